@@ -1,32 +1,186 @@
-from flask import Flask, request, jsonify, render_template, send_file, send_from_directory
+from flask import Blueprint, Flask, Response, current_app, g, has_app_context, has_request_context, request, jsonify, render_template, send_file, send_from_directory, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 import sqlite3
 import uuid
-from datetime import datetime
+import json
+import base64
+import bisect
+import csv
+import io
+import hashlib
+import html
+import importlib.util
+import mimetypes
+import queue
+import random
+import time
+import zlib
+from datetime import datetime, timedelta
 import os
+import sys
 import argparse
-from io import BytesIO
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak
-from reportlab.platypus.frames import Frame
-from reportlab.platypus.doctemplate import PageTemplate, BaseDocTemplate
-from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
 from werkzeug.utils import secure_filename
-from PIL import Image
 import shutil
+import zipfile
+from collections import OrderedDict
+from contextlib import contextmanager
 
-app = Flask(__name__)
+def lazy_import(name):
+    """Module that is only loaded when one of its attributes is first used"""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+# Imaging is loaded on first use, like reporting, whose imports live in the
+# report functions, so processes that only serve JSON never pay for either
+Image = lazy_import('PIL.Image')
+
+bp = Blueprint('plant_notes', __name__)
+
+# X-Sendfile for front servers that support it (Apache mod_xsendfile, lighttpd)
+USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE', '').lower() in ('1', 'true', 'yes')
+# Load imaging and reporting in create_app() rather than on first use, so
+# workers forked by gunicorn --preload share them
+PRELOAD_SUBSYSTEMS = os.environ.get('PRELOAD_SUBSYSTEMS', '').lower() in ('1', 'true', 'yes')
 
 # Configuration
-DATABASE = 'plant_notes.db'
-UPLOAD_FOLDER = 'uploads'
+DATABASE = os.environ.get('DATABASE', 'plant_notes.db')
+UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', 'uploads')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB max file size
 
-# Ensure upload directory exists
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+# Smaller renditions generated next to each uploaded image (longest side in pixels)
+IMAGE_DERIVATIVES = {
+    'preview': 800,
+    'thumbnail': 320,
+}
+DERIVATIVE_QUALITY = 80
+
+# Processed images are stored once per distinct content under
+# UPLOAD_FOLDER/BLOB_FOLDER and shared by every note they are attached to
+BLOB_FOLDER = 'blobs'
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Serving uploads: files are cached by clients for good, and workers cache
+# which (note, filename) pairs exist instead of querying on every request
+UPLOAD_MAX_AGE = 365 * 24 * 60 * 60
+UPLOAD_CACHE_SIZE = int(os.environ.get('UPLOAD_CACHE_SIZE', 4096))
+UPLOAD_CACHE_TTL = int(os.environ.get('UPLOAD_CACHE_TTL', 60))  # seconds
+# Internal location a front proxy (nginx) serves UPLOAD_FOLDER from; when
+# set, responses carry X-Accel-Redirect instead of the file
+UPLOAD_ACCEL_REDIRECT = os.environ.get('UPLOAD_ACCEL_REDIRECT', '')
+
+# Generated PDF reports, kept until the customer's notes change or the cache
+# outgrows its size limit
+REPORT_CACHE_FOLDER = os.environ.get('REPORT_CACHE_FOLDER', 'report_cache')
+REPORT_CACHE_MAX_BYTES = int(os.environ.get('REPORT_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+# Reports of customers with more notes than this are generated by a separate
+# process pool, and clients poll the job instead of waiting on the request
+REPORT_JOB_THRESHOLD = int(os.environ.get('REPORT_JOB_THRESHOLD', 200))
+REPORT_WORKERS = int(os.environ.get('REPORT_WORKERS', 1))
+REPORT_JOB_TIMEOUT = int(os.environ.get('REPORT_JOB_TIMEOUT', 600))  # seconds
+REPORT_JOB_RETENTION = 24 * 60 * 60  # seconds
+EXPORT_CHUNK_SIZE = 64 * 1024  # bytes copied into an export archive at a time
+
+# Bulk CSV imports: rows written per transaction, rejected rows listed in a
+# summary, and the directory image file paths are resolved under (imports
+# through the API reject image rows unless it is set)
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', 1000))
+IMPORT_MAX_ERRORS = 1000
+IMPORT_IMAGE_ROOT = os.environ.get('IMPORT_IMAGE_ROOT') or None
+
+# Data exports: table, columns in the order of the CSV files the importer
+# reads, and the column 'since' filters on
+DATA_EXPORTS = {
+    'customers': ('customers', ['id', 'name', 'email', 'phone', 'address', 'date_created'], 'date_created'),
+    'notes': ('plant_notes', ['id', 'customer_id', 'customer_name', 'plant_name', 'condition',
+                              'recommended_treatment', 'status', 'date_created', 'date_updated'], 'date_updated'),
+    'images': ('note_images', ['id', 'note_id', 'filename', 'original_filename', 'file_path', 'file_size',
+                               'date_uploaded', 'thumbnail_filename', 'preview_filename', 'processing_state',
+                               'blob_hash'], 'date_uploaded'),
+}
+
+# Background image processing: uploads are stored raw and resized by a
+# process pool instead of on the request thread
+ASYNC_IMAGE_PROCESSING = os.environ.get('ASYNC_IMAGE_PROCESSING', '').lower() in ('1', 'true', 'yes')
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 2))
+IMAGE_QUEUE_LIMIT = int(os.environ.get('IMAGE_QUEUE_LIMIT', 32))  # pending jobs per web worker
+DEFAULT_PAGE_LIMIT = 50  # page size when a cursor is given without a limit
+MAX_PAGE_LIMIT = 500
+SYNC_PAGE_LIMIT = 1000  # changes per page of a delta sync
+TYPEAHEAD_LIMIT = 10  # customers per typeahead response unless a limit is given
+TYPEAHEAD_MAX_LIMIT = 50
+
+# Change event streams: every stream polls change_log, so events from all
+# workers reach every client. Streams end after EVENT_STREAM_TIMEOUT and
+# clients reconnect after EVENT_RETRY_MS, resuming where they left off
+EVENT_POLL_INTERVAL = float(os.environ.get('EVENT_POLL_INTERVAL', 1.0))  # seconds
+EVENT_HEARTBEAT_INTERVAL = 15  # seconds
+EVENT_STREAM_TIMEOUT = int(os.environ.get('EVENT_STREAM_TIMEOUT', 60))  # seconds
+EVENT_RETRY_MS = 2000
+NOTE_BATCH_LIMIT = int(os.environ.get('NOTE_BATCH_LIMIT', 500))  # notes per batch create or update
+STREAM_BATCH_SIZE = 200  # rows fetched from the cursor per chunk of a streamed response
+
+# Full-text search: relative weight of each indexed column in the ranking,
+# and the markers snippet() puts around matches before they become <mark>
+SEARCH_COLUMN_WEIGHTS = {'plant_name': 4.0, 'condition': 2.0, 'recommended_treatment': 2.0, 'customer_name': 1.0}
+SNIPPET_OPEN, SNIPPET_CLOSE = '\x02', '\x03'
+SNIPPET_TOKENS = 16
+
+# Requests taking at least this long are logged with their slowest SQL
+# statements (0 disables the log)
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 0))
+SLOW_REQUEST_QUERIES = 10
+
+# SQLite tuning, overridable from the environment
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 16 * 1024))
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 64 * 1024 * 1024))
+
+# Write coordination: with WRITE_QUEUE, the writes of every request thread
+# in a worker go through one writer thread, which commits whatever is
+# pending together (group commit). Either way, writes that find the
+# database locked are retried with backoff before failing with a 503
+WRITE_QUEUE = os.environ.get('WRITE_QUEUE', '').lower() in ('1', 'true', 'yes')
+WRITE_BATCH_MAX = int(os.environ.get('WRITE_BATCH_MAX', 64))  # operations per transaction
+WRITE_RETRIES = int(os.environ.get('WRITE_RETRIES', 5))
+WRITE_RETRY_BACKOFF_MS = float(os.environ.get('WRITE_RETRY_BACKOFF_MS', 25))  # doubled per retry
+
+# Storage locations each application created by create_app() can set for
+# itself; read them with setting()
+STORAGE_SETTINGS = ('DATABASE', 'UPLOAD_FOLDER', 'REPORT_CACHE_FOLDER')
+
+def setting(name):
+    """A storage setting of the current application, or the module's outside one"""
+    if has_app_context():
+        return current_app.config[name]
+    return globals()[name]
+
+def storage_settings():
+    """The storage settings in effect, in STORAGE_SETTINGS order"""
+    return tuple(setting(name) for name in STORAGE_SETTINGS)
+
+def with_app_context(function):
+    """Wrap a callback run by another thread so it sees the current application's settings"""
+    if not has_app_context():
+        return function
+    flask_app = current_app._get_current_object()
+    def run(*args):
+        with flask_app.app_context():
+            return function(*args)
+    return run
 
 def allowed_file(filename):
     """Check if file extension is allowed"""
@@ -35,49 +189,985 @@ def allowed_file(filename):
 
 def get_customer_upload_path(customer_id):
     """Get the upload path for a specific customer"""
-    path = os.path.join(UPLOAD_FOLDER, customer_id)
+    path = os.path.join(setting('UPLOAD_FOLDER'), customer_id)
     os.makedirs(path, exist_ok=True)
     return path
 
 def get_note_upload_path(customer_id, note_id):
     """Get the upload path for a specific note"""
-    path = os.path.join(UPLOAD_FOLDER, customer_id, note_id)
+    path = os.path.join(setting('UPLOAD_FOLDER'), customer_id, note_id)
     os.makedirs(path, exist_ok=True)
     return path
 
-def resize_image(image_path, max_width=1200, max_height=1200, quality=85):
-    """Resize image to reduce file size while maintaining quality"""
+def flatten_image(img):
+    """Composite transparent images onto white so they can be saved as JPEG"""
+    if img.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
+        img = background
+    return img
+
+def write_atomically(file_path, write):
+    """Write a file through a temporary sibling that is renamed into place"""
+    temp_path = f"{file_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(temp_path, 'wb') as temp_file:
+            write(temp_file)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def derivative_filename(filename, kind):
+    """Filename of a derivative rendition stored next to the original image"""
+    return f"{filename.rsplit('.', 1)[0]}_{kind}.jpg"
+
+def write_image_derivatives(img, directory, filename):
+    """Write the preview and thumbnail renditions of a decoded image into directory"""
+    rendition = flatten_image(img)
+    if rendition.mode not in ('RGB', 'L'):
+        rendition = rendition.convert('RGB')
+    if rendition is img:
+        rendition = img.copy()
+    
+    # Shrink progressively, largest rendition first, so each one is
+    # resampled from the previous instead of from the full image
+    derivatives = {}
+    for kind, size in sorted(IMAGE_DERIVATIVES.items(), key=lambda item: -item[1]):
+        rendition.thumbnail((size, size), Image.Resampling.LANCZOS)
+        derivative = derivative_filename(filename, kind)
+        write_atomically(os.path.join(directory, derivative),
+                         lambda out: rendition.save(out, 'JPEG', optimize=True,
+                                                    quality=DERIVATIVE_QUALITY))
+        derivatives[kind] = derivative
+    return derivatives
+
+def create_image_derivatives(image_path):
+    """Write the preview and thumbnail renditions of an image file next to it.
+
+    Returns a dict mapping each derivative kind to its filename, or an empty
+    dict if the image could not be processed.
+    """
+    directory, filename = os.path.split(image_path)
+    largest = max(IMAGE_DERIVATIVES.values())
     try:
         with Image.open(image_path) as img:
-            # Convert RGBA to RGB if necessary
-            if img.mode in ('RGBA', 'LA', 'P'):
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                img = background
-            
-            # Calculate new dimensions
-            width, height = img.size
-            if width > max_width or height > max_height:
-                ratio = min(max_width/width, max_height/height)
-                new_width = int(width * ratio)
-                new_height = int(height * ratio)
-                img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            
-            # Save with optimization
-            img.save(image_path, optimize=True, quality=quality)
-            return True
+            img.draft(None, (largest, largest))
+            return write_image_derivatives(img, directory, filename)
+    except Exception as e:
+        print(f"Error creating derivatives for {image_path}: {str(e)}")
+        return {}
+
+def ingest_image(source, file_path, max_width=1200, max_height=1200, quality=85, in_place=False):
+    """Decode an image from a file object and write the stored image exactly once.
+
+    JPEGs larger than the limits are decoded at a reduced scale, and images
+    that already fit and need no conversion are stored byte for byte instead
+    of being re-encoded. With in_place, source is the file at file_path and is
+    left untouched when no re-encode is needed. Raises if the image cannot be
+    decoded; returns the stored file size and rendition filenames.
+    """
+    directory, filename = os.path.split(file_path)
+    image_format = Image.registered_extensions().get('.' + filename.rsplit('.', 1)[1].lower())
+    
+    with Image.open(source) as img:
+        width, height = img.size
+        fits = width <= max_width and height <= max_height
+        
+        if fits and img.format == image_format and img.mode not in ('RGBA', 'LA', 'P'):
+            if not in_place:
+                source.seek(0)
+                with timed('image_processing_seconds', stage='copy'):
+                    write_atomically(file_path, lambda out: shutil.copyfileobj(source, out))
+            # Only the renditions need pixels, so decode at their size
+            largest = max(IMAGE_DERIVATIVES.values())
+            img.draft(None, (largest, largest))
+            with timed('image_processing_seconds', stage='decode'):
+                img.load()
+            stored = img
+        else:
+            # Let the JPEG decoder scale down by up to 8x while decoding
+            img.draft(None, (max_width, max_height))
+            with timed('image_processing_seconds', stage='decode'):
+                img.load()
+            
+            with timed('image_processing_seconds', stage='resize'):
+                stored = flatten_image(img)
+                
+                # Calculate new dimensions
+                width, height = stored.size
+                if width > max_width or height > max_height:
+                    ratio = min(max_width/width, max_height/height)
+                    stored = stored.resize((int(width * ratio), int(height * ratio)),
+                                           Image.Resampling.LANCZOS)
+            
+            with timed('image_processing_seconds', stage='encode'):
+                write_atomically(file_path, lambda out: stored.save(out, image_format, optimize=True,
+                                                                    quality=quality))
+        
+        with timed('image_processing_seconds', stage='renditions'):
+            derivatives = write_image_derivatives(stored, directory, filename)
+    
+    return {
+        'file_size': os.path.getsize(file_path),
+        'thumbnail_filename': derivatives.get('thumbnail'),
+        'preview_filename': derivatives.get('preview')
+    }
+
+def hash_stream(source):
+    """SHA-256 hex digest of a file object's contents, leaving it rewound"""
+    digest = hashlib.sha256()
+    source.seek(0)
+    for chunk in iter(lambda: source.read(HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    source.seek(0)
+    return digest.hexdigest()
+
+def blob_extension(extension):
+    """Extension that blobs of an upload's format are stored under"""
+    return 'jpg' if extension == 'jpeg' else extension
+
+def get_blob_path(content_hash, extension):
+    """Path of a blob in the content-addressed store, fanned out by hash prefix"""
+    path = os.path.join(setting('UPLOAD_FOLDER'), BLOB_FOLDER, content_hash[:2])
+    os.makedirs(path, exist_ok=True)
+    return os.path.join(path, f"{content_hash}.{extension}")
+
+def blob_derivative_filenames(file_path):
+    """Filenames of the renditions stored next to a blob"""
+    filename = os.path.basename(file_path)
+    return [derivative_filename(filename, kind) for kind in IMAGE_DERIVATIVES]
+
+def store_image_blob(source, extension, source_hash):
+    """Process an image into the blob store and return the blob's details.
+    
+    The image is ingested into a staging file, then moved with its renditions
+    to a path named after the hash of the processed bytes, so identical
+    results share one file. Raises if the image cannot be decoded.
+    """
+    extension = blob_extension(extension)
+    staging_directory = os.path.join(setting('UPLOAD_FOLDER'), BLOB_FOLDER, 'staging')
+    os.makedirs(staging_directory, exist_ok=True)
+    staging_path = os.path.join(staging_directory, f"{uuid.uuid4()}.{extension}")
+    
+    try:
+        result = ingest_image(source, staging_path)
+        with open(staging_path, 'rb') as stored:
+            content_hash = hash_stream(stored)
+        
+        file_path = get_blob_path(content_hash, extension)
+        blob_directory = os.path.dirname(file_path)
+        for staged, renamed in zip(blob_derivative_filenames(staging_path),
+                                   blob_derivative_filenames(file_path)):
+            os.replace(os.path.join(staging_directory, staged), os.path.join(blob_directory, renamed))
+        # Move the image last, so a blob whose image exists is complete
+        os.replace(staging_path, file_path)
+    except BaseException:
+        remove_image_files(staging_path, blob_derivative_filenames(staging_path))
+        raise
+    
+    return {
+        'hash': content_hash,
+        'source_hash': source_hash,
+        'extension': extension,
+        'file_path': file_path,
+        'file_size': result['file_size']
+    }
+
+def find_image_blob(conn, source_hash, extension):
+    """Blob previously produced from the same upload bytes and format, if any"""
+    blob = conn.execute('''
+        SELECT hash, source_hash, extension, file_path, file_size FROM image_blobs
+        WHERE source_hash = ? AND extension = ?
+    ''', (source_hash, blob_extension(extension))).fetchone()
+    return dict(blob) if blob else None
+
+def blob_image_fields(blob):
+    """note_images columns of an image stored as a blob"""
+    filename = os.path.basename(blob['file_path'])
+    return {
+        'filename': filename,
+        'file_path': blob['file_path'],
+        'file_size': blob['file_size'],
+        'thumbnail_filename': derivative_filename(filename, 'thumbnail'),
+        'preview_filename': derivative_filename(filename, 'preview'),
+        'blob_hash': blob['hash']
+    }
+
+class BlobReclaimed(Exception):
+    """A blob's files were removed after an image was saved against it"""
+
+def blob_files_exist(blob):
+    """Whether a blob's image and all its renditions are on disk"""
+    directory = os.path.dirname(blob['file_path'])
+    paths = [blob['file_path']] + [os.path.join(directory, name)
+                                   for name in blob_derivative_filenames(blob['file_path'])]
+    return all(os.path.exists(path) for path in paths)
+
+def claim_image_blob(conn, blob):
+    """Make sure a blob is recorded, within the write transaction referencing it.
+    
+    Blob files are only removed under the write lock, by the transaction that
+    deletes the blob, so files present now stay for as long as this
+    transaction holds it. The blob is recorded again if it was deleted since
+    it was looked up. Raises BlobReclaimed if its files are gone.
+    """
+    if not blob_files_exist(blob):
+        raise BlobReclaimed(f"Blob {blob['hash']} was reclaimed")
+    insert_image_blob(conn, blob)
+
+def insert_image_blob(conn, blob):
+    """Record a newly stored blob, unless an identical one was recorded concurrently"""
+    conn.execute('''
+        INSERT OR IGNORE INTO image_blobs (hash, source_hash, extension, file_path, file_size, date_created)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (blob['hash'], blob['source_hash'], blob['extension'], blob['file_path'],
+          blob['file_size'], datetime.now().isoformat()))
+
+def delete_unreferenced_blobs(conn):
+    """Delete blobs no image refers to any more, files included, within the
+    caller's write transaction.
+    
+    The files are removed while the transaction holds the write lock, so an
+    upload recording the same blob either claims it first or finds the files
+    gone and stores them again (see claim_image_blob()).
+    """
+    paths = [row['file_path'] for row in
+             conn.execute('SELECT file_path FROM image_blobs WHERE ref_count <= 0')]
+    if paths:
+        conn.execute('DELETE FROM image_blobs WHERE ref_count <= 0')
+        remove_blob_files(paths)
+
+def remove_blob_files(paths):
+    """Delete reclaimed blobs and their renditions from the filesystem"""
+    for path in paths:
+        remove_image_files(path, blob_derivative_filenames(path))
+
+def process_image_file(file_path, source_hash=None):
+    """Process a raw upload into the blob store and return the blob's details.
+    
+    Runs in the image worker processes, so it takes and returns only plain
+    values. The raw file is left for the caller to remove once the result is
+    recorded. Raises if the image cannot be processed.
+    """
+    try:
+        with open(file_path, 'rb') as source:
+            if source_hash is None:
+                source_hash = hash_stream(source)
+            return store_image_blob(source, file_path.rsplit('.', 1)[1].lower(), source_hash)
+    except Exception as e:
+        print(f"Error processing image {file_path}: {str(e)}")
+        raise ValueError(f"Could not process image {os.path.basename(file_path)}")
+
+def save_uploaded_image(conn, file, customer_id, note_id, defer=False):
+    """Store an uploaded image, reusing the blob of an identical earlier upload.
+    
+    New images are processed into the blob store unless deferred, in which
+    case they are saved raw under the note's upload directory in the
+    'processing' state for queue_image_processing() to pick up once they are
+    recorded. Images that fail to process are kept raw as well.
+    """
+    file_extension = file.filename.rsplit('.', 1)[1].lower()
+    unique_filename = f"{uuid.uuid4()}.{file_extension}"
+    
+    image = {
+        'original_filename': file.filename,
+        'source_hash': hash_stream(file.stream),
+        'thumbnail_filename': None,
+        'preview_filename': None,
+        'processing_state': 'processing',
+        'processing_error': None,
+        'blob_hash': None,
+        'blob': None,
+        'new_blob': None,
+        'upload': file
+    }
+    
+    # The same bytes were uploaded before, so there is nothing to process
+    blob = find_image_blob(conn, image['source_hash'], file_extension)
+    if blob is None and not defer:
+        try:
+            blob = image['new_blob'] = store_image_blob(file.stream, file_extension,
+                                                        image['source_hash'])
+        except Exception as e:
+            # Keep the upload as it was sent so nothing is lost
+            print(f"Error processing image {file.filename}: {str(e)}")
+            image['processing_state'] = 'failed'
+            image['processing_error'] = f"Could not process image {unique_filename}"
+    
+    if blob is not None:
+        image.update(blob_image_fields(blob))
+        image['blob'] = blob
+        image['processing_state'] = 'ready'
+        return image
+    
+    file_path = os.path.join(get_note_upload_path(customer_id, note_id), unique_filename)
+    file.stream.seek(0)
+    file.save(file_path)
+    image['filename'] = unique_filename
+    image['file_path'] = file_path
+    image['file_size'] = os.path.getsize(file_path)
+    return image
+
+def discard_uploaded_images(images):
+    """Remove the files of saved images whose database write was rolled back"""
+    for image in images:
+        if image['blob_hash'] is None:
+            remove_image_files(image['file_path'], ())
+    new_blobs = [image['new_blob'] for image in images if image['new_blob'] is not None]
+    if not new_blobs:
+        return
+    
+    def write(conn):
+        # Under the write lock, so a concurrent upload of the same image has
+        # either recorded the blob or will find its files gone
+        for blob in new_blobs:
+            if not conn.execute('SELECT 1 FROM image_blobs WHERE hash = ?', (blob['hash'],)).fetchone():
+                remove_blob_files([blob['file_path']])
+    
+    try:
+        perform_write(write)
     except Exception as e:
-        print(f"Error resizing image {image_path}: {str(e)}")
-        return False
+        print(f"Error discarding uploaded images: {str(e)}")
+
+def restore_reclaimed_blobs(images):
+    """Store again, from their uploads, the blobs of saved images that were reclaimed"""
+    for image in images:
+        blob = image['blob']
+        if blob is None or blob_files_exist(blob):
+            continue
+        image['upload'].stream.seek(0)
+        blob = store_image_blob(image['upload'].stream, blob['extension'], image['source_hash'])
+        image.update(blob_image_fields(blob))
+        image['blob'] = image['new_blob'] = blob
+
+def perform_image_write(operation, images):
+    """perform_write() for an operation recording saved images.
+    
+    A concurrent delete can reclaim the blob an image was saved against
+    before the image is recorded; the blob is then stored again from the
+    upload and the operation retried.
+    """
+    try:
+        return perform_write(operation)
+    except BlobReclaimed:
+        restore_reclaimed_blobs(images)
+        return perform_write(operation)
+
+def insert_note_image(conn, note_id, image, date_uploaded):
+    """Record a saved image against a note and return the new image id"""
+    if image['blob'] is not None:
+        claim_image_blob(conn, image['blob'])
+    
+    image_id = str(uuid.uuid4())
+    conn.execute('''
+        INSERT INTO note_images (id, note_id, filename, original_filename, file_path,
+                                 file_size, date_uploaded, thumbnail_filename, preview_filename,
+                                 processing_state, processing_error, blob_hash)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (image_id, note_id, image['filename'], image['original_filename'],
+          image['file_path'], image['file_size'], date_uploaded,
+          image['thumbnail_filename'], image['preview_filename'],
+          image['processing_state'], image['processing_error'], image['blob_hash']))
+    return image_id
+
+def record_image_processing(conn, image_id, blob=None, error=None):
+    """Store the outcome of processing an image; returns False if the image is gone.
+    
+    Raises BlobReclaimed if the blob was reclaimed by a delete of an
+    identical image since it was stored.
+    """
+    def write(conn):
+        if error is not None:
+            return conn.execute('''
+                UPDATE note_images SET processing_state = 'failed', processing_error = ?
+                WHERE id = ?
+            ''', (error, image_id)).rowcount
+        
+        claim_image_blob(conn, blob)
+        image = blob_image_fields(blob)
+        updated = conn.execute('''
+            UPDATE note_images
+            SET filename = ?, file_path = ?, file_size = ?, thumbnail_filename = ?,
+                preview_filename = ?, blob_hash = ?,
+                processing_state = 'ready', processing_error = NULL
+            WHERE id = ?
+        ''', (image['filename'], image['file_path'], image['file_size'],
+              image['thumbnail_filename'], image['preview_filename'], image['blob_hash'],
+              image_id)).rowcount
+        # Nothing refers to the blob if the image was deleted meanwhile
+        delete_unreferenced_blobs(conn)
+        return updated
+    
+    return perform_write(write, conn) > 0
+
+# Background process pools by name, each with the pid of the process that
+# created it
+_process_pools = {}
+_process_pools_lock = threading.Lock()
+
+def configure_worker(database, upload_folder, report_cache_folder):
+    """Give a pool worker the storage locations of the process that started it"""
+    global DATABASE, UPLOAD_FOLDER, REPORT_CACHE_FOLDER
+    DATABASE, UPLOAD_FOLDER, REPORT_CACHE_FOLDER = database, upload_folder, report_cache_folder
+
+def get_process_pool(name, workers):
+    """Process pool for background work, created on first use.
+
+    Each set of storage settings gets its own pool, since workers are given
+    theirs when they start.
+    """
+    key = (name, storage_settings())
+    with _process_pools_lock:
+        pool, pid = _process_pools.get(key, (None, None))
+        # A pool inherited through fork() belongs to the parent process
+        if pool is None or pid != os.getpid():
+            pool = ProcessPoolExecutor(max_workers=workers,
+                                       mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=configure_worker,
+                                       initargs=key[1])
+            _process_pools[key] = (pool, os.getpid())
+        return pool
+
+def reset_process_pool(name):
+    """Drop a pool whose worker died so the next job starts a fresh one"""
+    with _process_pools_lock:
+        pool, _ = _process_pools.pop((name, storage_settings()), (None, None))
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def submit_job(name, workers, function, *args):
+    """Run function in the named pool, replacing the pool once if it is broken.
+
+    The returned future resolves once the metrics the job recorded in the
+    worker have been added to this process's.
+    """
+    try:
+        job = get_process_pool(name, workers).submit(run_with_metrics, function, *args)
+    except BrokenProcessPool:
+        reset_process_pool(name)
+        job = get_process_pool(name, workers).submit(run_with_metrics, function, *args)
+    
+    future = Future()
+    def relay(done):
+        try:
+            result, observations = done.result()
+        except BaseException as e:
+            future.set_exception(e)
+            return
+        for metric, value, labels in observations:
+            observe(metric, value, **labels)
+        future.set_result(result)
+    job.add_done_callback(relay)
+    return future
+
+_image_jobs_pending = 0
+_image_pool_lock = threading.Lock()
+
+def image_queue_has_room():
+    """Whether new uploads can be handed to the background pool"""
+    with _image_pool_lock:
+        return _image_jobs_pending < IMAGE_QUEUE_LIMIT
+
+def queue_image_processing(image_id, file_path, source_hash):
+    """Process a recorded raw image into the blob store in the background pool"""
+    global _image_jobs_pending
+    with _image_pool_lock:
+        _image_jobs_pending += 1
+    future = submit_job('images', IMAGE_WORKERS, process_image_file, file_path, source_hash)
+    future.add_done_callback(with_app_context(lambda done: _finish_image_job(image_id, file_path, done)))
+
+def _finish_image_job(image_id, file_path, future):
+    global _image_jobs_pending
+    with _image_pool_lock:
+        _image_jobs_pending -= 1
+    
+    result = None
+    error = None
+    try:
+        result = future.result()
+    except BrokenProcessPool as e:
+        error = f"Image worker stopped unexpectedly: {str(e)}"
+        print(f"Error processing image {image_id}: {error}")
+        reset_process_pool('images')
+    except Exception as e:
+        error = str(e)
+        print(f"Error processing image {image_id}: {error}")
+    
+    conn = get_db_connection()
+    try:
+        try:
+            record_image_processing(conn, image_id, result, error)
+        except BlobReclaimed:
+            # Process the raw file again rather than lose the image
+            try:
+                result, error = process_image_file(file_path), None
+            except Exception as e:
+                result, error = None, str(e)
+            record_image_processing(conn, image_id, result, error)
+        if result:
+            # The image now lives in the blob store
+            remove_image_files(file_path, ())
+    except Exception as e:
+        print(f"Error recording processed image {image_id}: {str(e)}")
+    finally:
+        conn.close()
+
+def remove_image_files(file_path, derivative_filenames):
+    """Delete an image and its derivatives from the filesystem"""
+    directory = os.path.dirname(file_path)
+    paths = [file_path] + [os.path.join(directory, name) for name in derivative_filenames if name]
+    for path in paths:
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+        except Exception as e:
+            print(f"Error deleting file {path}: {str(e)}")
+
+# Metrics of this process, exposed at /metrics in the Prometheus text format:
+# name -> (type, help, histogram buckets)
+METRICS = {
+    'http_request_duration_seconds': ('histogram', 'Time to handle a request, by endpoint',
+                                      (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)),
+    'http_request_sql_queries': ('histogram', 'SQL statements run per request, by endpoint',
+                                 (0, 1, 2, 5, 10, 25, 50, 100, 250)),
+    'http_request_sql_seconds': ('histogram', 'Time spent in SQLite per request, by endpoint',
+                                 (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)),
+    'http_slow_requests_total': ('counter', 'Requests slower than SLOW_REQUEST_MS, by endpoint', None),
+    'sql_query_duration_seconds': ('histogram', 'Time to run an SQL statement, by statement type',
+                                   (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1)),
+    'json_serialization_seconds': ('histogram', 'Time to serialize JSON responses',
+                                   (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1)),
+    'image_processing_seconds': ('histogram', 'Time spent on each stage of processing an image',
+                                 (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)),
+    'report_build_seconds': ('histogram', 'Time spent on each stage of generating a PDF report',
+                             (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)),
+    'write_batch_size': ('histogram', 'Queued write operations committed per transaction',
+                         (1, 2, 4, 8, 16, 32, 64, 128)),
+    'write_queue_wait_seconds': ('histogram', 'Time a write operation waited for the writer thread',
+                                 (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)),
+    'write_retries_total': ('counter', 'Write transactions retried because the database was locked', None),
+    'write_busy_failures_total': ('counter', 'Write operations failed after every retry', None),
+}
+
+# (name, labels) -> count for counters, or [count per bucket..., sum, count]
+# for histograms
+_metric_values = {}
+_metrics_lock = threading.Lock()
+# In pool workers, observations are collected here and handed back to the
+# process that submitted the job instead
+_metrics_outbox = None
+
+def observe(name, value, **labels):
+    """Add value to a histogram, or to a counter"""
+    if _metrics_outbox is not None:
+        _metrics_outbox.append((name, value, labels))
+        return
+    
+    kind, _, buckets = METRICS[name]
+    key = (name, tuple(sorted(labels.items())))
+    with _metrics_lock:
+        if kind == 'counter':
+            _metric_values[key] = _metric_values.get(key, 0) + value
+            return
+        series = _metric_values.get(key)
+        if series is None:
+            series = _metric_values[key] = [0] * len(buckets) + [0.0, 0]
+        index = bisect.bisect_left(buckets, value)
+        if index < len(buckets):
+            series[index] += 1
+        series[-2] += value
+        series[-1] += 1
 
-def get_db_connection():
-    """Get database connection with row factory for dict-like access"""
-    conn = sqlite3.connect(DATABASE)
+@contextmanager
+def timed(name, **labels):
+    """Observe how long the body of a with block takes in a histogram"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+def run_with_metrics(function, *args):
+    """Run a pool job, returning its result with the observations it made"""
+    global _metrics_outbox
+    _metrics_outbox = []
+    try:
+        return function(*args), _metrics_outbox
+    finally:
+        _metrics_outbox = None
+
+def render_metrics():
+    """Metrics of this process in the Prometheus text exposition format"""
+    def format_labels(labels):
+        if not labels:
+            return ''
+        escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+                   for _, value in labels)
+        return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+    
+    with _metrics_lock:
+        values = {key: list(value) if isinstance(value, list) else value
+                  for key, value in _metric_values.items()}
+    
+    lines = []
+    for name, (kind, description, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        for (metric, labels), value in sorted(values.items()):
+            if metric != name:
+                continue
+            if kind == 'counter':
+                lines.append(f'{name}{format_labels(labels)} {value}')
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets, value):
+                cumulative += count
+                lines.append(f'{name}_bucket{format_labels(labels + (("le", bound),))} {cumulative}')
+            lines.append(f'{name}_bucket{format_labels(labels + (("le", "+Inf"),))} {value[-1]}')
+            lines.append(f'{name}_sum{format_labels(labels)} {value[-2]}')
+            lines.append(f'{name}_count{format_labels(labels)} {value[-1]}')
+    return '\n'.join(lines) + '\n'
+
+def record_query(sql, duration):
+    """Count an SQL statement towards the metrics and the current request"""
+    words = sql.split(None, 1)
+    observe('sql_query_duration_seconds', duration, statement=words[0].upper() if words else 'OTHER')
+    if has_request_context() and 'sql_queries' in g:
+        g.sql_queries += 1
+        g.sql_seconds += duration
+        if g.slow_log is not None:
+            g.slow_log.append((duration, sql))
+
+class TimedConnection(sqlite3.Connection):
+    """SQLite connection that records the number and duration of its statements"""
+    
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            record_query(sql, time.perf_counter() - started)
+    
+    def executemany(self, sql, parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, parameters)
+        finally:
+            record_query(sql, time.perf_counter() - started)
+    
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            record_query('COMMIT', time.perf_counter() - started)
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """JSON provider that records how long responses take to serialize"""
+    
+    def dumps(self, obj, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            observe('json_serialization_seconds', elapsed)
+            if has_request_context() and 'json_seconds' in g:
+                g.json_seconds += elapsed
+
+@bp.before_app_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.sql_queries = 0
+    g.sql_seconds = 0.0
+    g.json_seconds = 0.0
+    # Individual statements are only kept when they may be logged
+    g.slow_log = [] if SLOW_REQUEST_MS > 0 else None
+
+@bp.after_app_request
+def record_request_metrics(response):
+    """Time the request per endpoint, and log the queries of slow requests"""
+    if 'request_started' not in g:
+        return response
+    elapsed = time.perf_counter() - g.request_started
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    observe('http_request_duration_seconds', elapsed,
+            endpoint=endpoint, method=request.method, status=response.status_code)
+    observe('http_request_sql_queries', g.sql_queries, endpoint=endpoint)
+    observe('http_request_sql_seconds', g.sql_seconds, endpoint=endpoint)
+    
+    if g.slow_log is not None and elapsed * 1000 >= SLOW_REQUEST_MS:
+        observe('http_slow_requests_total', 1, endpoint=endpoint)
+        print(f"Slow request: {request.method} {request.full_path.rstrip('?')} {response.status_code} "
+              f"in {elapsed * 1000:.1f}ms (SQL {g.sql_seconds * 1000:.1f}ms in {g.sql_queries} statements, "
+              f"JSON {g.json_seconds * 1000:.1f}ms)")
+        for duration, sql in sorted(g.slow_log, reverse=True)[:SLOW_REQUEST_QUERIES]:
+            print(f"  {duration * 1000:8.2f}ms  {' '.join(sql.split())[:200]}")
+    return response
+
+def get_db_connection(database=None):
+    """Open a new tuned database connection with row factory for dict-like access"""
+    database = database or setting('DATABASE')
+    # timeout installs SQLite's busy handler, so writers wait instead of failing
+    conn = sqlite3.connect(database, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000, factory=TimedConnection)
+    conn.database = database
     conn.row_factory = sqlite3.Row
+    # WAL lets readers and the writer proceed concurrently across workers
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute('PRAGMA foreign_keys = ON')
+    conn.execute(f'PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KB}')
+    conn.execute(f'PRAGMA mmap_size = {SQLITE_MMAP_SIZE}')
     return conn
 
+# Connections are kept per thread and handed to one app context at a time
+_thread_connections = threading.local()
+_pool_lock = threading.Lock()
+_pool_stats = {
+    'opened': 0,
+    'reused': 0,
+    'released': 0,
+    'rolled_back': 0,
+    'discarded': 0,
+}
+
+def _count_pool_event(event):
+    with _pool_lock:
+        _pool_stats[event] += 1
+
+def acquire_connection():
+    """Get this thread's persistent connection, opening it on first use"""
+    conn = getattr(_thread_connections, 'conn', None)
+    owner = getattr(_thread_connections, 'owner', None)
+    database = setting('DATABASE')
+    
+    # A connection inherited through fork() or opened for another database
+    # file must not be used; drop it and open a fresh one
+    if conn is not None and owner != (os.getpid(), database):
+        _thread_connections.conn = conn = None
+        _count_pool_event('discarded')
+    
+    if conn is None:
+        conn = get_db_connection(database)
+        _thread_connections.conn = conn
+        _thread_connections.owner = (os.getpid(), database)
+        _count_pool_event('opened')
+    else:
+        _count_pool_event('reused')
+    return conn
+
+def release_connection(conn):
+    """Return a connection to its thread, rolling back anything left uncommitted"""
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+            _count_pool_event('rolled_back')
+        _count_pool_event('released')
+    except sqlite3.Error as e:
+        # The connection is unusable; close it so the next request reopens
+        print(f"Discarding database connection: {str(e)}")
+        _thread_connections.conn = None
+        _count_pool_event('discarded')
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+def get_db():
+    """Get the database connection for the current app context"""
+    if 'db' not in g:
+        g.db = acquire_connection()
+    return g.db
+
+@bp.teardown_app_request
+def teardown_db(exception):
+    conn = g.pop('db', None)
+    if conn is not None:
+        release_connection(conn)
+
+def get_pool_stats():
+    """Snapshot of connection reuse counters for this worker process"""
+    with _pool_lock:
+        stats = dict(_pool_stats)
+    stats['pid'] = os.getpid()
+    stats['open'] = stats['opened'] - stats['discarded']
+    return stats
+
+class DatabaseBusy(Exception):
+    """A write still found the database locked after every retry"""
+
+def is_lock_error(e):
+    """Whether an SQLite error means another connection holds the write lock"""
+    return isinstance(e, sqlite3.OperationalError) and ('locked' in str(e) or 'busy' in str(e))
+
+def commit_writes(conn, operations):
+    """Run write operations in one transaction and return their outcomes.
+
+    Each operation is a function of the connection and runs under its own
+    savepoint, so one that raises is rolled back without failing the others.
+    Returns an (ok, value) pair per operation, value being its result or the
+    exception it raised. Lock errors roll back the whole transaction and
+    propagate so it can be retried.
+    """
+    # Taking the write lock up front means a transaction never has to
+    # upgrade from reading, which SQLite fails at once instead of waiting
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        outcomes = []
+        for operation in operations:
+            conn.execute('SAVEPOINT write_operation')
+            try:
+                outcomes.append((True, operation(conn)))
+            except Exception as e:
+                if is_lock_error(e):
+                    raise
+                conn.execute('ROLLBACK TO write_operation')
+                outcomes.append((False, e))
+            conn.execute('RELEASE write_operation')
+        conn.commit()
+        return outcomes
+    except BaseException:
+        conn.rollback()
+        raise
+
+def run_writes(conn, operations):
+    """commit_writes(), retried with jittered exponential backoff while the
+    database is locked; raises DatabaseBusy once the retries run out"""
+    for attempt in range(WRITE_RETRIES + 1):
+        try:
+            return commit_writes(conn, operations)
+        except sqlite3.OperationalError as e:
+            if not is_lock_error(e):
+                raise
+            if attempt == WRITE_RETRIES:
+                observe('write_busy_failures_total', len(operations))
+                raise DatabaseBusy(f"Database is busy: {str(e)}") from e
+            observe('write_retries_total', 1)
+            time.sleep(random.uniform(0, WRITE_RETRY_BACKOFF_MS * 2 ** attempt) / 1000)
+
+# Write queues of this process by database, with the pid that started
+# their writer threads
+_write_queues = {}
+_write_queue_lock = threading.Lock()
+
+def get_write_queue(database):
+    """Queue feeding this process's writer thread for a database, started on first use"""
+    with _write_queue_lock:
+        pending, pid = _write_queues.get(database, (None, None))
+        # The writer thread of a parent process does not survive fork()
+        if pending is None or pid != os.getpid():
+            pending = queue.Queue()
+            _write_queues[database] = (pending, os.getpid())
+            threading.Thread(target=write_queued_operations, args=(pending, database),
+                             name='database-writer', daemon=True).start()
+        return pending
+
+def write_queued_operations(pending, database):
+    """Writer thread: commit queued operations in batches, one transaction each.
+
+    Whatever queues up while a transaction commits goes into the next one,
+    so batches grow with the write load instead of waiting to fill.
+    """
+    conn = get_db_connection(database)
+    while True:
+        batch = [pending.get()]
+        while len(batch) < WRITE_BATCH_MAX:
+            try:
+                batch.append(pending.get_nowait())
+            except queue.Empty:
+                break
+        
+        started = time.perf_counter()
+        for _, _, queued in batch:
+            observe('write_queue_wait_seconds', started - queued)
+        observe('write_batch_size', len(batch))
+        
+        try:
+            outcomes = run_writes(conn, [operation for operation, _, _ in batch])
+        except Exception as e:
+            print(f"Error committing {len(batch)} queued writes: {str(e)}")
+            outcomes = [(False, e)] * len(batch)
+        for (_, future, _), (ok, value) in zip(batch, outcomes):
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+def perform_write(operation, conn=None):
+    """Run operation(conn) in a write transaction and return its result.
+
+    With WRITE_QUEUE the operation is handed to this process's writer thread
+    and may share a transaction with other requests' writes, so it must only
+    use the connection it is given and leave side effects outside the
+    database (files, caches) to the caller once this returns. It is rerun if
+    the database is locked, so it must not change anything else either.
+    Otherwise it runs on conn, the request's connection by default, which
+    threads outside a request pass in. Raises what the operation raised, or
+    DatabaseBusy.
+    """
+    if not WRITE_QUEUE:
+        outcomes = run_writes(conn or get_db(), [operation])
+    else:
+        future = Future()
+        database = conn.database if conn is not None else setting('DATABASE')
+        get_write_queue(database).put((operation, future, time.perf_counter()))
+        outcomes = [(True, future.result())]
+    
+    ok, value = outcomes[0]
+    if not ok:
+        raise value
+    return value
+
+def serialize_image(customer_id, note_id, image):
+    """Build the API representation of a note image row"""
+    base_url = f"/uploads/{customer_id}/{note_id}"
+    url = f"{base_url}/{image['filename']}"
+    # Images without derivatives (not yet backfilled) fall back to the original
+    return {
+        'id': image['id'],
+        'filename': image['filename'],
+        'original_filename': image['original_filename'],
+        'url': url,
+        'thumbnail_url': f"{base_url}/{image['thumbnail_filename']}" if image['thumbnail_filename'] else url,
+        'preview_url': f"{base_url}/{image['preview_filename']}" if image['preview_filename'] else url,
+        'processing_state': image['processing_state']
+    }
+
+def fetch_note_images(conn, note_ids):
+    """Fetch images for many notes in a single query, grouped by note id"""
+    images_by_note = {note_id: [] for note_id in note_ids}
+    if not note_ids:
+        return images_by_note
+    # Pass the ids as one JSON array so the query doesn't hit SQLite's
+    # host parameter limit however many notes are being listed
+    rows = conn.execute('''
+        SELECT id, note_id, filename, original_filename, thumbnail_filename, preview_filename,
+               processing_state
+        FROM note_images
+        WHERE note_id IN (SELECT value FROM json_each(?))
+        ORDER BY note_id, date_uploaded, rowid
+    ''', (json.dumps(note_ids),))
+    for row in rows:
+        images_by_note[row['note_id']].append(row)
+    return images_by_note
+
+def hydrate_notes(conn, notes):
+    """Convert note rows to dicts with their images attached"""
+    images_by_note = fetch_note_images(conn, [note['id'] for note in notes])
+    notes_with_images = []
+    for note in notes:
+        note_dict = dict(note)
+        note_dict['images'] = [
+            serialize_image(note['customer_id'], note['id'], img)
+            for img in images_by_note[note['id']]
+        ]
+        notes_with_images.append(note_dict)
+    return notes_with_images
+
 def init_db():
     """Initialize the database with required tables"""
     conn = get_db_connection()
@@ -125,96 +1215,1695 @@ def init_db():
     ''')
     
     conn.commit()
+    
+    migrate_db(conn)
+    conn.close()
+
+def revision_triggers(table, scopes):
+    """Triggers bumping the revision of every scope a write to table touches.
+
+    scopes are SQL expressions naming a scope of the row {row}; updates bump
+    the scopes of both the old and the new row. Rows whose scope is NULL are
+    skipped.
+    """
+    events = {'INSERT': ('NEW',), 'UPDATE': ('OLD', 'NEW'), 'DELETE': ('OLD',)}
+    triggers = []
+    for event, rows in events.items():
+        touched = ' UNION '.join(f'SELECT {scope.format(row=row)} AS scope'
+                                 for row in rows for scope in scopes)
+        triggers.append(f'''CREATE TRIGGER {table}_revision_{event.lower()} AFTER {event} ON {table}
+           BEGIN
+               INSERT INTO revisions (scope, revision)
+               SELECT scope, 1 FROM ({touched}) WHERE scope IS NOT NULL
+               ON CONFLICT (scope) DO UPDATE SET revision = revision + 1;
+           END''')
+    return triggers
+
+def status_summary_triggers():
+    """Triggers keeping status_summary counts in step with plant_notes.
+
+    Each note counts once towards its customer and once towards 'all'. An
+    update moves the note from its old status to its new one, which nets out
+    when the status is unchanged but still records the activity.
+    """
+    def count(row, delta):
+        touched = f"SELECT {row}.customer_id, {row}.status UNION ALL SELECT 'all', {row}.status"
+        activity = 'NULL' if row == 'OLD' else f'{row}.date_updated'
+        return f'''INSERT INTO status_summary (scope, status, note_count, last_activity)
+               SELECT *, {delta}, {activity} FROM ({touched}) WHERE true
+               ON CONFLICT (scope, status) DO UPDATE SET
+                   note_count = note_count + excluded.note_count,
+                   last_activity = coalesce(max(last_activity, excluded.last_activity), last_activity, excluded.last_activity);'''
+    events = {
+        'INSERT': ('INSERT', [('NEW', 1)]),
+        'UPDATE': ('UPDATE OF customer_id, status, date_updated', [('OLD', -1), ('NEW', 1)]),
+        'DELETE': ('DELETE', [('OLD', -1)])
+    }
+    triggers = []
+    for event, (trigger_event, rows) in events.items():
+        steps = '\n               '.join(count(row, delta) for row, delta in rows)
+        triggers.append(f'''CREATE TRIGGER plant_notes_summary_{event.lower()} AFTER {trigger_event} ON plant_notes
+           BEGIN
+               {steps}
+           END''')
+    return triggers
+
+def change_log_triggers(table, entity):
+    """Triggers recording every write to table in change_log.
+
+    Each entity keeps only its latest change: an earlier entry is replaced by
+    one with a new sequence number, so the log grows with the number of
+    entities rather than writes, and deletes are kept as tombstones.
+    """
+    triggers = []
+    for event, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+        triggers.append(f'''CREATE TRIGGER {table}_change_{event.lower()} AFTER {event} ON {table}
+           BEGIN
+               DELETE FROM change_log WHERE entity = '{entity}' AND entity_id = {row}.id;
+               INSERT INTO change_log (entity, entity_id, operation) VALUES ('{entity}', {row}.id, '{event.lower()}');
+           END''')
+    return triggers
+
+# Schema migrations, applied in order and tracked with PRAGMA user_version.
+# Migration N brings the schema to user_version N. Each step is an SQL
+# statement or a callable taking the connection. Only append to this list.
+MIGRATIONS = [
+    ('Add indexes for note listings and image lookups', [
+        'CREATE INDEX IF NOT EXISTS idx_plant_notes_date_created ON plant_notes (date_created, id)',
+        'CREATE INDEX IF NOT EXISTS idx_plant_notes_customer ON plant_notes (customer_id, date_created, id)',
+        'CREATE INDEX IF NOT EXISTS idx_plant_notes_customer_status ON plant_notes (customer_id, status, date_created, id)',
+        'CREATE INDEX IF NOT EXISTS idx_plant_notes_status ON plant_notes (status, date_created, id)',
+        # Covers the batched image fetch in fetch_note_images()
+        'CREATE INDEX IF NOT EXISTS idx_note_images_note ON note_images (note_id, date_uploaded, id, filename, original_filename)',
+        # Covers the existence check in uploaded_file()
+        'CREATE INDEX IF NOT EXISTS idx_note_images_note_filename ON note_images (note_id, filename, file_path)',
+    ]),
+    ('Gather query planner statistics', [
+        'ANALYZE',
+    ]),
+    ('Record thumbnail and preview renditions of images', [
+        'ALTER TABLE note_images ADD COLUMN thumbnail_filename TEXT',
+        'ALTER TABLE note_images ADD COLUMN preview_filename TEXT',
+        'DROP INDEX IF EXISTS idx_note_images_note',
+        '''CREATE INDEX idx_note_images_note ON note_images
+           (note_id, date_uploaded, id, filename, original_filename, thumbnail_filename, preview_filename)''',
+    ]),
+    ('Track background image processing state', [
+        "ALTER TABLE note_images ADD COLUMN processing_state TEXT NOT NULL DEFAULT 'ready'",
+        'ALTER TABLE note_images ADD COLUMN processing_error TEXT',
+        "CREATE INDEX idx_note_images_unprocessed ON note_images (processing_state) WHERE processing_state != 'ready'",
+        'DROP INDEX IF EXISTS idx_note_images_note',
+        '''CREATE INDEX idx_note_images_note ON note_images
+           (note_id, date_uploaded, id, filename, original_filename, thumbnail_filename,
+            preview_filename, processing_state)''',
+    ]),
+    ('Store processed images as shared, reference counted blobs', [
+        '''CREATE TABLE image_blobs (
+            hash TEXT PRIMARY KEY,
+            source_hash TEXT NOT NULL,
+            extension TEXT NOT NULL,
+            file_path TEXT NOT NULL,
+            file_size INTEGER NOT NULL,
+            ref_count INTEGER NOT NULL DEFAULT 0,
+            date_created TEXT NOT NULL
+        )''',
+        # Finds the blob of an upload before it is processed
+        'CREATE INDEX idx_image_blobs_source ON image_blobs (source_hash, extension)',
+        'CREATE INDEX idx_image_blobs_unreferenced ON image_blobs (ref_count) WHERE ref_count <= 0',
+        'ALTER TABLE note_images ADD COLUMN blob_hash TEXT REFERENCES image_blobs (hash)',
+        # References are counted by triggers, so cascading note deletes are included
+        '''CREATE TRIGGER note_images_blob_insert AFTER INSERT ON note_images
+           WHEN NEW.blob_hash IS NOT NULL
+           BEGIN
+               UPDATE image_blobs SET ref_count = ref_count + 1 WHERE hash = NEW.blob_hash;
+           END''',
+        '''CREATE TRIGGER note_images_blob_delete AFTER DELETE ON note_images
+           WHEN OLD.blob_hash IS NOT NULL
+           BEGIN
+               UPDATE image_blobs SET ref_count = ref_count - 1 WHERE hash = OLD.blob_hash;
+           END''',
+        '''CREATE TRIGGER note_images_blob_update AFTER UPDATE OF blob_hash ON note_images
+           WHEN OLD.blob_hash IS NOT NEW.blob_hash
+           BEGIN
+               UPDATE image_blobs SET ref_count = ref_count - 1 WHERE hash = OLD.blob_hash;
+               UPDATE image_blobs SET ref_count = ref_count + 1 WHERE hash = NEW.blob_hash;
+           END''',
+    ]),
+    ('Track revisions of customers and notes for conditional requests', [
+        '''CREATE TABLE revisions (
+            scope TEXT PRIMARY KEY,
+            revision INTEGER NOT NULL
+        ) WITHOUT ROWID''',
+        # Random per database, so tags never repeat if the database is recreated
+        "INSERT INTO revisions (scope, revision) VALUES ('epoch', abs(random()) % 1000000000)",
+        *revision_triggers('customers', ["'customers'"]),
+        *revision_triggers('plant_notes', ["'notes'", "'customer:' || {row}.customer_id"]),
+        # Images count towards the customer of their note. Cascading deletes
+        # find the note gone, but deleting it has bumped the revisions already
+        *revision_triggers('note_images', [
+            "'notes'",
+            "(SELECT 'customer:' || customer_id FROM plant_notes WHERE id = {row}.note_id)"
+        ]),
+    ]),
+    ('Index note modification times per customer for report fingerprints', [
+        'CREATE INDEX idx_plant_notes_customer_updated ON plant_notes (customer_id, date_updated)',
+        'ANALYZE plant_notes',
+    ]),
+    ('Track background report generation jobs', [
+        '''CREATE TABLE report_jobs (
+            id TEXT PRIMARY KEY,
+            customer_id TEXT NOT NULL,
+            state TEXT NOT NULL,
+            file_path TEXT,
+            error TEXT,
+            date_created TEXT NOT NULL,
+            date_completed TEXT,
+            FOREIGN KEY (customer_id) REFERENCES customers (id) ON DELETE CASCADE
+        )''',
+        'CREATE INDEX idx_report_jobs_customer ON report_jobs (customer_id, state, date_created)',
+        'CREATE INDEX idx_report_jobs_date_created ON report_jobs (date_created)',
+    ]),
+    ('Add a full-text search index over notes', [
+        # External content table reading the text from plant_notes by rowid
+        '''CREATE VIRTUAL TABLE notes_fts USING fts5(
+            plant_name, condition, recommended_treatment, customer_name,
+            content='plant_notes', content_rowid='rowid', tokenize='porter unicode61'
+        )''',
+        '''CREATE TRIGGER plant_notes_fts_insert AFTER INSERT ON plant_notes
+           BEGIN
+               INSERT INTO notes_fts (rowid, plant_name, condition, recommended_treatment, customer_name)
+               VALUES (NEW.rowid, NEW.plant_name, NEW.condition, NEW.recommended_treatment, NEW.customer_name);
+           END''',
+        '''CREATE TRIGGER plant_notes_fts_delete AFTER DELETE ON plant_notes
+           BEGIN
+               INSERT INTO notes_fts (notes_fts, rowid, plant_name, condition, recommended_treatment, customer_name)
+               VALUES ('delete', OLD.rowid, OLD.plant_name, OLD.condition, OLD.recommended_treatment, OLD.customer_name);
+           END''',
+        '''CREATE TRIGGER plant_notes_fts_update
+           AFTER UPDATE OF plant_name, condition, recommended_treatment, customer_name ON plant_notes
+           BEGIN
+               INSERT INTO notes_fts (notes_fts, rowid, plant_name, condition, recommended_treatment, customer_name)
+               VALUES ('delete', OLD.rowid, OLD.plant_name, OLD.condition, OLD.recommended_treatment, OLD.customer_name);
+               INSERT INTO notes_fts (rowid, plant_name, condition, recommended_treatment, customer_name)
+               VALUES (NEW.rowid, NEW.plant_name, NEW.condition, NEW.recommended_treatment, NEW.customer_name);
+           END''',
+        # Index the notes written before search existed
+        "INSERT INTO notes_fts (notes_fts) VALUES ('rebuild')",
+    ]),
+    ('Keep per-customer note counts by status for dashboards and reports', [
+        # scope is a customer id, or 'all' for every customer
+        '''CREATE TABLE status_summary (
+            scope TEXT NOT NULL,
+            status TEXT NOT NULL,
+            note_count INTEGER NOT NULL DEFAULT 0,
+            last_activity TEXT,
+            PRIMARY KEY (scope, status)
+        ) WITHOUT ROWID''',
+        *status_summary_triggers(),
+        # Count the notes written before the summary existed
+        '''INSERT INTO status_summary (scope, status, note_count, last_activity)
+           SELECT customer_id, status, COUNT(*), MAX(date_updated) FROM plant_notes GROUP BY customer_id, status
+           UNION ALL
+           SELECT 'all', status, COUNT(*), MAX(date_updated) FROM plant_notes GROUP BY status''',
+    ]),
+    ('Index modification and upload times for incremental data exports', [
+        'CREATE INDEX idx_plant_notes_date_updated ON plant_notes (date_updated, id)',
+        'CREATE INDEX idx_note_images_date_uploaded ON note_images (date_uploaded, id)',
+    ]),
+    ('Log changes to customers, notes and images for delta sync', [
+        # AUTOINCREMENT keeps sequence numbers increasing even when the
+        # latest entry is replaced
+        '''CREATE TABLE change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            entity TEXT NOT NULL,
+            entity_id TEXT NOT NULL,
+            operation TEXT NOT NULL
+        )''',
+        'CREATE UNIQUE INDEX idx_change_log_entity ON change_log (entity, entity_id)',
+        *change_log_triggers('customers', 'customer'),
+        *change_log_triggers('plant_notes', 'note'),
+        *change_log_triggers('note_images', 'image'),
+        # Existing rows are the first changes a new client syncs
+        '''INSERT INTO change_log (entity, entity_id, operation)
+           SELECT 'customer', id, 'insert' FROM customers
+           UNION ALL SELECT 'note', id, 'insert' FROM plant_notes
+           UNION ALL SELECT 'image', id, 'insert' FROM note_images''',
+    ]),
+    ('Index customer names case-insensitively for typeahead search', [
+        # Lets LIKE 'prefix%' (case-insensitive by default) scan a range
+        'CREATE INDEX idx_customers_name_nocase ON customers (name COLLATE NOCASE)',
+    ]),
+]
+
+def get_schema_version(conn):
+    """Current schema version of the database"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate_db(conn):
+    """Apply pending schema migrations in place and return the schema version"""
+    while True:
+        # Take the write lock before checking the version so that concurrent
+        # workers starting up don't apply the same migration twice
+        conn.execute('BEGIN IMMEDIATE')
+        version = get_schema_version(conn)
+        if version >= len(MIGRATIONS):
+            conn.rollback()
+            return version
+        
+        description, steps = MIGRATIONS[version]
+        print(f"Applying migration {version + 1}: {description}")
+        try:
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(f'PRAGMA user_version = {version + 1}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+def backfill_image_derivatives():
+    """Process images left unprocessed and generate missing renditions"""
+    conn = get_db_connection()
+    images = conn.execute('''
+        SELECT id, file_path, processing_state FROM note_images
+        WHERE processing_state != 'ready'
+           OR thumbnail_filename IS NULL OR preview_filename IS NULL
+    ''').fetchall()
+    
+    processed = 0
+    failed = 0
+    for image in images:
+        if not os.path.exists(image['file_path']):
+            print(f"Skipping image {image['id']}: {image['file_path']} is missing")
+            failed += 1
+            continue
+        
+        if image['processing_state'] != 'ready':
+            # Uploads whose background job was lost, e.g. to a worker restart
+            try:
+                record_image_processing(conn, image['id'], process_image_file(image['file_path']))
+                remove_image_files(image['file_path'], ())
+                processed += 1
+            except Exception as e:
+                record_image_processing(conn, image['id'], error=str(e))
+                failed += 1
+            continue
+        
+        derivatives = create_image_derivatives(image['file_path'])
+        if not derivatives:
+            failed += 1
+            continue
+        
+        conn.execute('''
+            UPDATE note_images SET thumbnail_filename = ?, preview_filename = ?
+            WHERE id = ?
+        ''', (derivatives['thumbnail'], derivatives['preview'], image['id']))
+        conn.commit()
+        processed += 1
+    
+    conn.close()
+    print(f"Processed {processed} images ({failed} failed)")
+
+def rebuild_search_index():
+    """Re-index every note for full-text search, e.g. after a VACUUM renumbered rowids"""
+    conn = get_db_connection()
+    conn.execute("INSERT INTO notes_fts (notes_fts) VALUES ('rebuild')")
+    conn.commit()
+    count = conn.execute('SELECT COUNT(*) FROM plant_notes').fetchone()[0]
     conn.close()
+    print(f"Indexed {count} notes for search")
+
+def encode_cursor(values):
+    """Encode keyset pagination values as an opaque cursor string"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, size):
+    """Decode a cursor produced by encode_cursor, raising ValueError if malformed"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != size or \
+            not all(type(value) in (str, int, float) for value in values):
+        raise ValueError('Invalid cursor')
+    return values
+
+def parse_page_args(cursor_size):
+    """Read the limit, after and stream query parameters of a listing request"""
+    limit = request.args.get('limit')
+    after = request.args.get('after')
+    stream = request.args.get('stream', '').lower() in ('1', 'true', 'yes')
+    
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValueError('Invalid limit')
+        if limit < 1 or limit > MAX_PAGE_LIMIT:
+            raise ValueError(f'Limit must be between 1 and {MAX_PAGE_LIMIT}')
+    elif after and not stream:
+        limit = DEFAULT_PAGE_LIMIT
+    
+    if after:
+        after = decode_cursor(after, cursor_size)
+    
+    return limit, after, stream
+
+def paginate(conn, query, params, limit, cursor_columns):
+    """Fetch one page of a keyset-ordered query plus the cursor for the next page"""
+    rows = conn.execute(f'{query} LIMIT ?', (*params, limit + 1)).fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1][column] for column in cursor_columns])
+    return rows, next_cursor
+
+def escape_like(text):
+    """Escape LIKE wildcards in text, for patterns using ESCAPE '\\'"""
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def search_customers(conn, text, limit):
+    """Customers matching typed text, best first, with their note counts.
 
-@app.route('/')
+    Names starting with the text come first, read in order from the
+    case-insensitive name index. Only when they do not fill the limit are
+    names, emails, phones and addresses containing the text scanned for,
+    names first. Each hit says which way it matched.
+    """
+    prefix = escape_like(text) + '%'
+    hits = [dict(row, match='prefix') for row in conn.execute('''
+        SELECT id, name, email, phone FROM customers
+        WHERE name LIKE ? ESCAPE '\\'
+        ORDER BY name COLLATE NOCASE, id
+        LIMIT ?
+    ''', (prefix, limit))]
+    
+    if text and len(hits) < limit:
+        contains = f'%{escape_like(text)}%'
+        for row in conn.execute('''
+            SELECT id, name, email, phone, name LIKE :contains ESCAPE '\\' AS in_name
+            FROM customers
+            WHERE name NOT LIKE :prefix ESCAPE '\\'
+              AND (name LIKE :contains ESCAPE '\\' OR email LIKE :contains ESCAPE '\\'
+                   OR phone LIKE :contains ESCAPE '\\' OR address LIKE :contains ESCAPE '\\')
+            ORDER BY in_name DESC, name COLLATE NOCASE, id
+            LIMIT :limit
+        ''', {'prefix': prefix, 'contains': contains, 'limit': limit - len(hits)}):
+            hit = dict(row, match='name' if row['in_name'] else 'contact')
+            del hit['in_name']
+            hits.append(hit)
+    
+    counts = {row['scope']: row for row in conn.execute('''
+        SELECT scope, SUM(note_count) AS note_count, MAX(last_activity) AS last_activity
+        FROM status_summary WHERE scope IN (SELECT value FROM json_each(?))
+        GROUP BY scope
+    ''', (json.dumps([hit['id'] for hit in hits]),))}
+    for hit in hits:
+        summary = counts.get(hit['id'])
+        hit['note_count'] = summary['note_count'] if summary else 0
+        hit['last_activity'] = summary['last_activity'] if summary else None
+    return hits
+
+def build_search_query(text):
+    """FTS5 query matching notes that contain every word of text, the last as a prefix.
+
+    Words are quoted so that characters with a meaning in FTS5 query syntax
+    are searched for literally. Returns None if text has no words.
+    """
+    words = text.split()
+    if not words:
+        return None
+    terms = ['"' + word.replace('"', '""') + '"' for word in words]
+    # Match words still being typed
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+def render_snippet(snippet):
+    """HTML for a search snippet, escaping note text and marking the matches"""
+    return html.escape(snippet or '').replace(SNIPPET_OPEN, '<mark>').replace(SNIPPET_CLOSE, '</mark>')
+
+def stream_json_rows(query, params, serialize_rows):
+    """Stream query results as a JSON array without holding every row in memory"""
+    def generate():
+        conn = get_db()
+        cursor = conn.execute(query, params)
+        yield '['
+        separator = ''
+        while True:
+            rows = cursor.fetchmany(STREAM_BATCH_SIZE)
+            if not rows:
+                break
+            yield separator + ','.join(json.dumps(item) for item in serialize_rows(conn, rows))
+            separator = ','
+        yield ']'
+    
+    # Keep the app context (and with it the connection) alive while streaming
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+def fetch_sync_records(conn, entity, ids):
+    """Current rows of changed entities, as sent to sync clients"""
+    if entity == 'image':
+        rows = conn.execute('''
+            SELECT i.*, n.customer_id FROM note_images i JOIN plant_notes n ON n.id = i.note_id
+            WHERE i.id IN (SELECT value FROM json_each(?))
+        ''', (json.dumps(ids),))
+        return [dict(serialize_image(row['customer_id'], row['note_id'], row), note_id=row['note_id'])
+                for row in rows]
+    table = 'customers' if entity == 'customer' else 'plant_notes'
+    return [dict(row) for row in conn.execute(
+        f'SELECT * FROM {table} WHERE id IN (SELECT value FROM json_each(?))', (json.dumps(ids),))]
+
+def get_changes(conn, checkpoint, limit):
+    """Customers, notes and images changed after a sync checkpoint.
+
+    Returns up to limit changes and the checkpoint to continue from. A
+    checkpoint from another database (or none) starts over from the first
+    change, which is flagged as a reset so clients drop what they hold.
+    """
+    # One read transaction, so rows match the log entries they are sent for
+    conn.execute('BEGIN')
+    try:
+        epoch = conn.execute("SELECT revision FROM revisions WHERE scope = 'epoch'").fetchone()[0]
+        reset = checkpoint is None or checkpoint[0] != epoch
+        after = 0 if reset else checkpoint[1]
+        
+        changes = conn.execute('''
+            SELECT seq, entity, entity_id, operation FROM change_log
+            WHERE seq > ? ORDER BY seq LIMIT ?
+        ''', (after, limit + 1)).fetchall()
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+        
+        # Each entity appears at most once in the log, so a page is a set of
+        # upserts and deletes per kind of entity
+        result = {'reset': reset}
+        for entity, key in (('customer', 'customers'), ('note', 'notes'), ('image', 'images')):
+            changed = [change for change in changes if change['entity'] == entity]
+            result[key] = fetch_sync_records(conn, entity, [change['entity_id'] for change in changed
+                                                            if change['operation'] != 'delete'])
+            result[f'deleted_{key}'] = [change['entity_id'] for change in changed
+                                        if change['operation'] == 'delete']
+    finally:
+        conn.rollback()
+    
+    last_seq = changes[-1]['seq'] if changes else after
+    result['checkpoint'] = encode_cursor([epoch, last_seq])
+    result['has_more'] = has_more
+    return result
+
+# Server-sent event names of change_log entries
+CHANGE_EVENTS = {
+    ('customer', 'insert'): 'customer_added',
+    ('customer', 'update'): 'customer_updated',
+    ('customer', 'delete'): 'customer_deleted',
+    ('note', 'insert'): 'note_created',
+    ('note', 'update'): 'note_updated',
+    ('note', 'delete'): 'note_deleted',
+    ('image', 'insert'): 'image_added',
+    ('image', 'update'): 'image_updated',
+    ('image', 'delete'): 'image_removed',
+}
+
+def get_change_events(conn, after, limit):
+    """Change events for change_log entries after sequence number after.
+
+    Returns (seq, event name, data) triples and the last sequence number
+    read. Notes come with their images, images with their note_id; deletes
+    carry only the id.
+    """
+    changes = conn.execute('''
+        SELECT seq, entity, entity_id, operation FROM change_log
+        WHERE seq > ? ORDER BY seq LIMIT ?
+    ''', (after, limit)).fetchall()
+    if not changes:
+        return [], after
+    
+    records = {}
+    for entity in ('customer', 'note', 'image'):
+        ids = [change['entity_id'] for change in changes
+               if change['entity'] == entity and change['operation'] != 'delete']
+        if not ids:
+            continue
+        if entity == 'note':
+            rows = conn.execute('SELECT * FROM plant_notes WHERE id IN (SELECT value FROM json_each(?))',
+                                (json.dumps(ids),)).fetchall()
+            found = hydrate_notes(conn, rows)
+        else:
+            found = fetch_sync_records(conn, entity, ids)
+        records.update(((entity, record['id']), record) for record in found)
+    
+    events = []
+    for change in changes:
+        if change['operation'] == 'delete':
+            data = {'id': change['entity_id']}
+        else:
+            data = records.get((change['entity'], change['entity_id']))
+            if data is None:
+                # Deleted since it was logged; its tombstone follows
+                continue
+        events.append((change['seq'], CHANGE_EVENTS[(change['entity'], change['operation'])], data))
+    return events, changes[-1]['seq']
+
+def stream_change_events(last_event_id=None):
+    """Yield server-sent events for writes made by any worker, by polling change_log.
+
+    Starts after last_event_id when it is from this database, otherwise with
+    the next change. The connection is only borrowed for each poll, and the
+    stream ends after EVENT_STREAM_TIMEOUT so it does not hold a worker
+    thread for long; browsers reconnect and resume from Last-Event-ID.
+    """
+    conn = acquire_connection()
+    try:
+        epoch = conn.execute("SELECT revision FROM revisions WHERE scope = 'epoch'").fetchone()[0]
+        try:
+            event_epoch, after = (int(part) for part in (last_event_id or '').split('.'))
+        except ValueError:
+            event_epoch, after = None, 0
+        if event_epoch != epoch:
+            after = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM change_log').fetchone()[0]
+    finally:
+        release_connection(conn)
+    
+    yield f"retry: {EVENT_RETRY_MS}\n\n"
+    deadline = time.monotonic() + EVENT_STREAM_TIMEOUT
+    last_sent = time.monotonic()
+    while time.monotonic() < deadline:
+        conn = acquire_connection()
+        try:
+            events, after = get_change_events(conn, after, STREAM_BATCH_SIZE)
+        finally:
+            release_connection(conn)
+        if events:
+            yield ''.join(f"id: {epoch}.{seq}\nevent: {name}\ndata: {json.dumps(data)}\n\n"
+                          for seq, name, data in events)
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent >= EVENT_HEARTBEAT_INTERVAL:
+            # Comment line, so dropped connections are noticed and closed
+            yield ": keepalive\n\n"
+            last_sent = time.monotonic()
+        time.sleep(EVENT_POLL_INTERVAL)
+
+def revision_etag(conn, *scopes):
+    """ETag for a response that only changes when one of the scopes' revisions does.
+
+    Revisions are bumped by triggers on every write. The request's path and
+    query are folded in so each listing, page and filter gets its own tag.
+    """
+    # Read the revisions before the rows: data newer than its tag only causes
+    # a refetch later, never a stale 304
+    scopes = ('epoch',) + scopes
+    revisions = dict(conn.execute(
+        'SELECT scope, revision FROM revisions WHERE scope IN (SELECT value FROM json_each(?))',
+        (json.dumps(scopes),)).fetchall())
+    marker = '.'.join(str(revisions.get(scope, 0)) for scope in scopes)
+    digest = hashlib.sha1(request.full_path.encode()).hexdigest()[:16]
+    return f"{marker}-{digest}"
+
+def not_modified(etag):
+    """Empty 304 response for a client already holding etag"""
+    return tag_response(Response(status=304), etag)
+
+def tag_response(response, etag):
+    """Attach etag to a response and have clients revalidate it before reuse"""
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+def get_status_summary(conn, scope):
+    """Note counts by status of a customer, or of every customer for scope
+    'all', and when a note was last added or edited, read from the
+    precomputed summary"""
+    summary = {'healthy': 0, 'unhealthy': 0, 'treated': 0}
+    last_activity = None
+    for row in conn.execute('SELECT status, note_count, last_activity FROM status_summary WHERE scope = ?',
+                            (scope,)):
+        summary[row['status']] = row['note_count']
+        if last_activity is None or (row['last_activity'] or '') > last_activity:
+            last_activity = row['last_activity']
+    summary['total'] = sum(summary.values())
+    summary['last_activity'] = last_activity
+    return summary
+
+_report_styles = None
+
+def get_report_styles():
+    """Paragraph and table styles of the PDF reports, built once per process"""
+    global _report_styles
+    if _report_styles is not None:
+        return _report_styles
+    
+    from reportlab.lib import colors
+    from reportlab.lib.enums import TA_CENTER
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.platypus import TableStyle
+    
+    styles = getSampleStyleSheet()
+    note_table_style = [
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+        ('TOPPADDING', (0, 0), (-1, -1), 4),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('TEXTCOLOR', (0, 1), (0, 1), colors.white),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ]
+    # Status-based coloring
+    status_colors = {
+        'healthy': colors.HexColor('#10b981'),
+        'unhealthy': colors.HexColor('#ef4444'),
+        'treated': colors.HexColor('#3b82f6'),
+    }
+    
+    _report_styles = {
+        'title': ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=24,
+            spaceAfter=30,
+            alignment=TA_CENTER,
+            textColor=colors.HexColor('#2563eb')
+        ),
+        'heading': ParagraphStyle(
+            'CustomHeading',
+            parent=styles['Heading2'],
+            fontSize=16,
+            spaceAfter=12,
+            spaceBefore=20,
+            textColor=colors.HexColor('#1f2937')
+        ),
+        'normal': ParagraphStyle(
+            'CustomNormal',
+            parent=styles['Normal'],
+            fontSize=11,
+            spaceAfter=6,
+            textColor=colors.HexColor('#374151')
+        ),
+        'footer': ParagraphStyle(
+            'Footer',
+            parent=styles['Normal'],
+            fontSize=9,
+            alignment=TA_CENTER,
+            textColor=colors.grey
+        ),
+        'customer_table': TableStyle([
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
+            ('FONTSIZE', (0, 0), (-1, -1), 11),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+            ('TOPPADDING', (0, 0), (-1, -1), 4),
+        ]),
+        'note_tables': {
+            status: TableStyle(note_table_style + [('BACKGROUND', (0, 1), (0, 1), color)])
+            for status, color in status_colors.items()
+        },
+    }
+    return _report_styles
+
+def build_report_elements(customer, notes, summary):
+    """Flowables of the PDF report for a customer and their notes, newest first,
+    headed by the customer's status summary"""
+    from reportlab.lib.units import inch
+    from reportlab.platypus import Paragraph, Spacer, Table
+    
+    styles = get_report_styles()
+    normal_style = styles['normal']
+    
+    # Container for the 'Flowable' objects
+    elements = []
+    
+    # Title
+    title = Paragraph("Plant Care Report", styles['title'])
+    elements.append(title)
+    elements.append(Spacer(1, 20))
+    
+    # Customer Information
+    customer_heading = Paragraph("Customer Information", styles['heading'])
+    elements.append(customer_heading)
+    
+    customer_data = [
+        ['Name:', customer['name']],
+        ['Email:', customer['email'] or 'Not provided'],
+        ['Phone:', customer['phone'] or 'Not provided'],
+        ['Address:', customer['address'] or 'Not provided'],
+        ['Customer Since:', datetime.fromisoformat(customer['date_created']).strftime('%B %d, %Y')]
+    ]
+    
+    customer_table = Table(customer_data, colWidths=[1.5*inch, 4*inch])
+    customer_table.setStyle(styles['customer_table'])
+    
+    elements.append(customer_table)
+    elements.append(Spacer(1, 30))
+    
+    # Plant Care Notes
+    notes_heading = Paragraph("Plant Care Notes", styles['heading'])
+    elements.append(notes_heading)
+    
+    if not notes:
+        no_notes = Paragraph("No plant care notes found for this customer.", normal_style)
+        elements.append(no_notes)
+    else:
+        # Summary statistics
+        summary_text = (f"Total Plants: {summary['total']} | Healthy: {summary['healthy']} | "
+                        f"Unhealthy: {summary['unhealthy']} | Treated: {summary['treated']}")
+        summary = Paragraph(summary_text, normal_style)
+        elements.append(summary)
+        elements.append(Spacer(1, 20))
+        
+        # Individual notes (images are excluded from reports as requested)
+        for i, note in enumerate(notes):
+            # Note header
+            note_title = f"{note['plant_name']} - {note['status'].title()}"
+            note_heading = Paragraph(f"<b>{note_title}</b>", normal_style)
+            elements.append(note_heading)
+            
+            # Note details
+            note_data = [
+                ['Date:', datetime.fromisoformat(note['date_created']).strftime('%B %d, %Y')],
+                ['Status:', note['status'].title()],
+                ['Condition:', note['condition']],
+                ['Treatment:', note['recommended_treatment']]
+            ]
+            
+            if note['date_updated'] != note['date_created']:
+                note_data.append(['Last Updated:', datetime.fromisoformat(note['date_updated']).strftime('%B %d, %Y')])
+            
+            note_table = Table(note_data, colWidths=[1.2*inch, 4.3*inch])
+            note_table.setStyle(styles['note_tables'].get(note['status'], styles['note_tables']['treated']))
+            
+            elements.append(note_table)
+            
+            # Add space between notes
+            if i < len(notes) - 1:
+                elements.append(Spacer(1, 20))
+    
+    # Footer
+    elements.append(Spacer(1, 30))
+    footer_text = f"Report generated on {datetime.now().strftime('%B %d, %Y at %I:%M %p')}"
+    footer = Paragraph(footer_text, styles['footer'])
+    elements.append(footer)
+    
+    return elements
+
+def write_report_pdf(file_path, customer, notes, summary):
+    """Lay out a customer's report and write it to file_path"""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate
+    
+    def build(out):
+        doc = SimpleDocTemplate(out, pagesize=letter, rightMargin=72, leftMargin=72, 
+                                topMargin=72, bottomMargin=18)
+        with timed('report_build_seconds', stage='elements'):
+            elements = build_report_elements(customer, notes, summary)
+        with timed('report_build_seconds', stage='build'):
+            doc.build(elements)
+    
+    write_atomically(file_path, build)
+
+def report_fingerprint(conn, customer_id):
+    """Number of notes of a customer, and a fingerprint that changes whenever one
+    of them is added, edited or deleted"""
+    count, last_updated = conn.execute('''
+        SELECT COUNT(*), MAX(date_updated) FROM plant_notes WHERE customer_id = ?
+    ''', (customer_id,)).fetchone()
+    return count, f"{count}-{hashlib.sha1((last_updated or '').encode()).hexdigest()[:16]}"
+
+def get_report_cache_path(customer_id, fingerprint):
+    """Path of a customer's cached report for the given notes fingerprint"""
+    folder = setting('REPORT_CACHE_FOLDER')
+    os.makedirs(folder, exist_ok=True)
+    return os.path.abspath(os.path.join(folder, f"{customer_id}_{fingerprint}.pdf"))
+
+def evict_report_cache(keep):
+    """Drop stale reports of keep's customer, then least recently used reports over the size limit"""
+    keep_name = os.path.basename(keep)
+    customer_prefix = keep_name.split('_', 1)[0] + '_'
+    reports = []
+    for entry in os.scandir(setting('REPORT_CACHE_FOLDER')):
+        if not entry.name.endswith('.pdf') or entry.name == keep_name:
+            continue
+        try:
+            if entry.name.startswith(customer_prefix):
+                os.remove(entry.path)
+            else:
+                stat = entry.stat()
+                reports.append((stat.st_mtime, stat.st_size, entry.path))
+        except FileNotFoundError:
+            # Evicted by another worker
+            pass
+    
+    total = os.path.getsize(keep) + sum(size for _, size, _ in reports)
+    for _, size, path in sorted(reports):
+        if total <= REPORT_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+def get_customer_report(conn, customer, file_path):
+    """Make sure a customer's report is cached at file_path, generating it if
+    needed, and return the path"""
+    try:
+        # Bump the modification time, which orders eviction
+        os.utime(file_path)
+        return file_path
+    except FileNotFoundError:
+        pass
+    
+    notes = conn.execute('''
+        SELECT * FROM plant_notes 
+        WHERE customer_id = ? 
+        ORDER BY date_created DESC
+    ''', (customer['id'],)).fetchall()
+    
+    write_report_pdf(file_path, customer, notes, get_status_summary(conn, customer['id']))
+    evict_report_cache(file_path)
+    return file_path
+
+def generate_report_file(customer_id):
+    """Bring a customer's cached report up to date and return its path.
+
+    Runs in the report worker processes. Raises if the customer no longer
+    exists or the report cannot be written.
+    """
+    conn = get_db_connection()
+    try:
+        customer = conn.execute('SELECT * FROM customers WHERE id = ?', (customer_id,)).fetchone()
+        if not customer:
+            raise ValueError(f"Customer {customer_id} not found")
+        _, fingerprint = report_fingerprint(conn, customer_id)
+        return get_customer_report(conn, customer, get_report_cache_path(customer_id, fingerprint))
+    finally:
+        conn.close()
+
+def serialize_report_job(job):
+    """API representation of a report job"""
+    return {
+        'id': job['id'],
+        'customer_id': job['customer_id'],
+        'state': job['state'],
+        'error': job['error'],
+        'date_created': job['date_created'],
+        'date_completed': job['date_completed'],
+        'status_url': f"/api/report-jobs/{job['id']}",
+        'download_url': f"/api/report-jobs/{job['id']}/download" if job['state'] == 'ready' else None
+    }
+
+def start_report_job(conn, customer_id):
+    """Generate a customer's report in the report pool, joining a job already running"""
+    now = datetime.now()
+    job_id = str(uuid.uuid4())
+    
+    def write(conn):
+        # Checked under the write lock, so concurrent requests join one job
+        job = conn.execute('''
+            SELECT * FROM report_jobs
+            WHERE customer_id = ? AND state = 'processing' AND date_created > ?
+            ORDER BY date_created DESC LIMIT 1
+        ''', (customer_id, (now - timedelta(seconds=REPORT_JOB_TIMEOUT)).isoformat())).fetchone()
+        if job:
+            return job
+        
+        conn.execute('''
+            INSERT INTO report_jobs (id, customer_id, state, date_created)
+            VALUES (?, ?, 'processing', ?)
+        ''', (job_id, customer_id, now.isoformat()))
+        # Forget jobs nobody is going to poll any more
+        conn.execute('DELETE FROM report_jobs WHERE date_created < ?',
+                     ((now - timedelta(seconds=REPORT_JOB_RETENTION)).isoformat(),))
+        return None
+    
+    job = perform_write(write, conn)
+    if job:
+        return job
+    
+    try:
+        future = submit_job('reports', REPORT_WORKERS, generate_report_file, customer_id)
+        future.add_done_callback(with_app_context(lambda done: _finish_report_job(job_id, done)))
+    except Exception as e:
+        print(f"Error starting report job {job_id}: {str(e)}")
+        record_report_job(conn, job_id, error='Could not start report generation')
+    
+    return get_report_job(conn, job_id)
+
+def record_report_job(conn, job_id, file_path=None, error=None):
+    """Store the outcome of a report job"""
+    date_completed = datetime.now().isoformat()
+    perform_write(lambda conn: conn.execute('''
+        UPDATE report_jobs SET state = ?, file_path = ?, error = ?, date_completed = ?
+        WHERE id = ?
+    ''', ('failed' if error else 'ready', file_path, error, date_completed, job_id)), conn)
+
+def _finish_report_job(job_id, future):
+    file_path = None
+    error = None
+    try:
+        file_path = future.result()
+    except BrokenProcessPool as e:
+        error = f"Report worker stopped unexpectedly: {str(e)}"
+        print(f"Error generating report {job_id}: {error}")
+        reset_process_pool('reports')
+    except Exception as e:
+        error = 'Failed to generate report'
+        print(f"Error generating report {job_id}: {str(e)}")
+    
+    conn = get_db_connection()
+    try:
+        record_report_job(conn, job_id, file_path, error)
+    except Exception as e:
+        print(f"Error recording report job {job_id}: {str(e)}")
+    finally:
+        conn.close()
+
+def get_report_job(conn, job_id):
+    """A report job, failing it if it has been processing for too long"""
+    job = conn.execute('SELECT * FROM report_jobs WHERE id = ?', (job_id,)).fetchone()
+    if job and job['state'] == 'processing':
+        started = datetime.fromisoformat(job['date_created'])
+        # The web worker that owned the job was restarted
+        if datetime.now() - started > timedelta(seconds=REPORT_JOB_TIMEOUT):
+            record_report_job(conn, job_id, error='Report generation timed out')
+            job = conn.execute('SELECT * FROM report_jobs WHERE id = ?', (job_id,)).fetchone()
+    return job
+
+class ZipStream:
+    """Write-only file object that hands out what ZipFile has written so far.
+
+    It cannot seek, so ZipFile writes sizes after each member's data and the
+    archive can be sent while it is being built.
+    """
+    
+    def __init__(self):
+        self.chunks = []
+    
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def report_archive_name(customer, used_names):
+    """Unique filename of a customer's report inside an export archive"""
+    name = secure_filename(f"plant_care_report_{customer['name'].replace(' ', '_')}.pdf")
+    if not name or name in used_names:
+        name = f"plant_care_report_{customer['id']}.pdf"
+    used_names.add(name)
+    return name
+
+def iter_customer_reports(conn, customers, pool=None):
+    """Yield (customer, file_path, state) for each customer as their report becomes ready.
+
+    Cached reports come first; the rest are generated concurrently in pool,
+    a (name, workers) pair defaulting to the report pool, and yielded in the
+    order they finish. state is 'cached', 'generated' or 'failed' (with
+    file_path None).
+    """
+    pool_name, workers = pool or ('reports', REPORT_WORKERS)
+    pending = {}
+    for customer in customers:
+        _, fingerprint = report_fingerprint(conn, customer['id'])
+        file_path = get_report_cache_path(customer['id'], fingerprint)
+        if os.path.exists(file_path):
+            yield customer, file_path, 'cached'
+        else:
+            future = submit_job(pool_name, workers, generate_report_file, customer['id'])
+            pending[future] = customer
+    
+    for future in as_completed(pending):
+        customer = pending[future]
+        try:
+            yield customer, future.result(), 'generated'
+        except BrokenProcessPool as e:
+            print(f"Error generating report for customer {customer['id']}: {str(e)}")
+            reset_process_pool(pool_name)
+            yield customer, None, 'failed'
+        except Exception as e:
+            print(f"Error generating report for customer {customer['id']}: {str(e)}")
+            yield customer, None, 'failed'
+
+def stream_reports_zip(conn, customers, progress=None, pool=None):
+    """Yield a ZIP archive of the customers' reports in chunks as it is built.
+
+    Reports are copied in from the report cache EXPORT_CHUNK_SIZE bytes at a
+    time, so memory use does not grow with the archive. The archive ends with
+    export_summary.json listing what happened to each customer's report.
+    progress is called with (done, total, customer, state) after each one,
+    and pool is passed on to iter_customer_reports().
+    """
+    stream = ZipStream()
+    archive = zipfile.ZipFile(stream, 'w', zipfile.ZIP_STORED)
+    used_names = set()
+    summary = []
+    
+    for done, (customer, file_path, state) in enumerate(iter_customer_reports(conn, customers, pool), 1):
+        entry = {'customer_id': customer['id'], 'customer_name': customer['name'], 'state': state}
+        if file_path:
+            entry['filename'] = report_archive_name(customer, used_names)
+            try:
+                with open(file_path, 'rb') as source:
+                    # Dated when the report was generated; a member opened
+                    # by name would be dated 1980
+                    generated = time.localtime(os.fstat(source.fileno()).st_mtime)
+                    info = zipfile.ZipInfo(entry['filename'], date_time=generated[:6])
+                    info.compress_type = archive.compression
+                    with archive.open(info, 'w') as member:
+                        for chunk in iter(lambda: source.read(EXPORT_CHUNK_SIZE), b''):
+                            member.write(chunk)
+                            yield stream.drain()
+            except FileNotFoundError:
+                # Evicted from the report cache before it could be copied
+                entry['state'] = 'failed'
+                del entry['filename']
+        summary.append(entry)
+        if progress:
+            progress(done, len(customers), customer, entry['state'])
+    
+    archive.writestr('export_summary.json', json.dumps(summary, indent=2))
+    archive.close()
+    yield stream.drain()
+
+def print_export_progress(done, total, customer, state):
+    """Report progress of a report export on stdout"""
+    print(f"[{done}/{total}] {customer['name']}: {state}")
+
+def select_export_customers(conn, customer_ids=None):
+    """Customers whose reports are exported, all of them unless customer_ids is given"""
+    if customer_ids:
+        return conn.execute('''
+            SELECT id, name FROM customers
+            WHERE id IN (SELECT value FROM json_each(?))
+            ORDER BY name
+        ''', (json.dumps(customer_ids),)).fetchall()
+    return conn.execute('SELECT id, name FROM customers ORDER BY name').fetchall()
+
+def export_reports(output_path, customer_ids=None):
+    """Write a ZIP archive of customer reports to output_path, using every CPU"""
+    conn = get_db_connection()
+    try:
+        customers = select_export_customers(conn, customer_ids)
+        def write(out):
+            for chunk in stream_reports_zip(conn, customers, print_export_progress,
+                                            ('export', os.cpu_count())):
+                out.write(chunk)
+        write_atomically(output_path, write)
+    finally:
+        conn.close()
+    print(f"Exported {len(customers)} reports to {output_path}")
+
+def iter_export_rows(conn, kind, since=None, with_images=False):
+    """Yield batches of rows of a data export straight from the cursor.
+
+    Rows come oldest first by the column since filters on. Notes can carry
+    their images' metadata, fetched once per batch.
+    """
+    table, columns, date_column = DATA_EXPORTS[kind]
+    query = f'SELECT {", ".join(columns)} FROM {table}'
+    params = []
+    if since:
+        query += f' WHERE {date_column} >= ?'
+        params.append(since)
+    query += f' ORDER BY {date_column}, id'
+    
+    cursor = conn.execute(query, params)
+    while True:
+        rows = cursor.fetchmany(STREAM_BATCH_SIZE)
+        if not rows:
+            break
+        yield hydrate_notes(conn, rows) if with_images else [dict(row) for row in rows]
+
+def format_export_rows(kind, batches, export_format):
+    """Encode batches of export rows as CSV (with a header) or NDJSON text chunks"""
+    if export_format == 'ndjson':
+        for rows in batches:
+            yield ''.join(json.dumps(row) + '\n' for row in rows)
+        return
+    
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=DATA_EXPORTS[kind][1], lineterminator='\n')
+    writer.writeheader()
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+def stream_data_export(conn, kind, export_format='csv', since=None, compress=False):
+    """Yield a customers, notes or images export as bytes, gzipped on the fly if
+    compress is set. Memory use does not grow with the size of the table."""
+    batches = iter_export_rows(conn, kind, since, with_images=kind == 'notes' and export_format == 'ndjson')
+    compressor = zlib.compressobj(wbits=31) if compress else None  # gzip container
+    for text in format_export_rows(kind, batches, export_format):
+        data = text.encode()
+        if compressor:
+            data = compressor.compress(data)
+        if data:
+            yield data
+    if compressor:
+        yield compressor.flush()
+
+def export_data_filename(kind, export_format, compress=False):
+    """File name of an export, matching the CSV files the importer reads"""
+    name = f"{DATA_EXPORTS[kind][0]}.{export_format}"
+    return f"{name}.gz" if compress else name
+
+def export_data(directory, export_format='csv', since=None, compress=False):
+    """Write customers, notes and images exports to files in directory"""
+    os.makedirs(directory, exist_ok=True)
+    conn = get_db_connection()
+    try:
+        # One read transaction, so the files are a consistent snapshot
+        conn.execute('BEGIN')
+        for kind in DATA_EXPORTS:
+            file_path = os.path.join(directory, export_data_filename(kind, export_format, compress))
+            def write(out):
+                for chunk in stream_data_export(conn, kind, export_format, since, compress):
+                    out.write(chunk)
+            write_atomically(file_path, write)
+            print(f"Exported {kind} to {file_path}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+class BulkImporter:
+    """Load customers, notes and images from CSV files in batched transactions.
+
+    Files are parsed a row at a time and valid rows are written
+    IMPORT_BATCH_SIZE at a time with executemany(), one transaction per
+    batch. Customers are matched by name through an in-memory map, so notes
+    can name their customer by an id from the exporting system or by name.
+    Rows that were imported before (same id, or same customer name) are
+    skipped, which makes it safe to rerun an import; invalid rows are
+    rejected and reported with their line number.
+    """
+    
+    def __init__(self, conn, image_root=None, copy_images=False, pool=None, progress=None):
+        self.conn = conn
+        self.image_root = image_root
+        self.copy_images = copy_images
+        self.pool_name, self.workers = pool or ('images', IMAGE_WORKERS)
+        self.progress = progress
+        self.results = []
+        self.errors = []
+        self.error_count = 0
+        # Customer ids by name and names by id, for every customer in the database
+        self.customer_ids = {}
+        self.customer_names = {}
+        for customer in conn.execute('SELECT id, name FROM customers'):
+            self.customer_ids[customer['name']] = customer['id']
+            self.customer_names[customer['id']] = customer['name']
+        # Ids in the CSV of customers that already existed under another id
+        self.customer_aliases = {}
+    
+    def import_customers(self, source):
+        """Import customers from a CSV file object (id, name, email, phone, address, date_created)"""
+        return self._import('customers', source, self._parse_customer, self._write_customers)
+    
+    def import_notes(self, source):
+        """Import notes from a CSV file object, after their customers"""
+        return self._import('notes', source, self._parse_note, self._write_notes)
+    
+    def import_images(self, source):
+        """Import images from a CSV file object, after their notes. file_path is
+        resolved under image_root; without one, image rows are rejected."""
+        return self._import('images', source, self._parse_image, self._write_images)
+    
+    def summary(self):
+        """Counts and timings of every file imported so far, and the rejected rows"""
+        rows = sum(result['rows'] for result in self.results)
+        seconds = sum(result['seconds'] for result in self.results)
+        return {
+            'files': self.results,
+            'rows': rows,
+            'imported': sum(result['imported'] for result in self.results),
+            'skipped': sum(result['skipped'] for result in self.results),
+            'failed': self.error_count,
+            'seconds': round(seconds, 3),
+            'rows_per_second': round(rows / seconds) if seconds else rows,
+            'errors': self.errors
+        }
+    
+    def _import(self, kind, source, parse, write):
+        """Parse source row by row, writing valid rows in batches"""
+        started = time.perf_counter()
+        result = {'file': kind, 'rows': 0, 'imported': 0, 'skipped': 0, 'failed': 0}
+        reader = csv.DictReader(source)
+        batch = []
+        for row in reader:
+            result['rows'] += 1
+            try:
+                batch.append((reader.line_num, parse(row)))
+            except ValueError as e:
+                self._reject(result, reader.line_num, str(e))
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                self._write_batch(result, write, batch)
+                batch = []
+        if batch:
+            self._write_batch(result, write, batch)
+        
+        elapsed = time.perf_counter() - started
+        result['seconds'] = round(elapsed, 3)
+        result['rows_per_second'] = round(result['rows'] / elapsed) if elapsed else result['rows']
+        self.results.append(result)
+        return result
+    
+    def _write_batch(self, result, write, batch):
+        result['imported'] += write(result, batch)
+        result['skipped'] = result['rows'] - result['imported'] - result['failed']
+        if self.progress:
+            self.progress(result)
+    
+    def _reject(self, result, line, error):
+        result['failed'] += 1
+        self.error_count += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({'file': result['file'], 'line': line, 'error': error})
+    
+    def _insert(self, result, statement, rows, blobs=()):
+        """Insert rows of (line, values) in one write operation and return the
+        lines written. If a constraint fails, rows are retried one at a time so
+        that only the offending ones are rejected. Raises BlobReclaimed if one
+        of the blobs was reclaimed since it was stored."""
+        def write(conn):
+            for blob in blobs:
+                claim_image_blob(conn, blob)
+            conn.execute('SAVEPOINT import_batch')
+            try:
+                conn.executemany(statement, [values for _, values in rows])
+                conn.execute('RELEASE import_batch')
+                return [line for line, _ in rows], []
+            except sqlite3.IntegrityError:
+                conn.execute('ROLLBACK TO import_batch')
+                conn.execute('RELEASE import_batch')
+            
+            # A failing statement undoes only its own row
+            written = []
+            rejected = []
+            for line, values in rows:
+                try:
+                    conn.execute(statement, values)
+                    written.append(line)
+                except sqlite3.IntegrityError as e:
+                    rejected.append((line, str(e)))
+            if blobs:
+                # Blobs of rejected images are not referenced by anything
+                delete_unreferenced_blobs(conn)
+            return written, rejected
+        
+        written, rejected = perform_write(write, self.conn)
+        for line, error in rejected:
+            self._reject(result, line, error)
+        return written
+    
+    def _existing_ids(self, table, ids):
+        """The subset of ids already present in table"""
+        return {row['id'] for row in self.conn.execute(
+            f'SELECT id FROM {table} WHERE id IN (SELECT value FROM json_each(?))', (json.dumps(list(ids)),))}
+    
+    def _parse_customer(self, row):
+        name = (row.get('name') or '').strip()
+        if not name:
+            raise ValueError('Customer name is required')
+        return {
+            'id': row.get('id') or str(uuid.uuid4()),
+            'name': name,
+            'email': row.get('email') or None,
+            'phone': row.get('phone') or None,
+            'address': row.get('address') or None,
+            'date_created': parse_import_date(row.get('date_created'))
+        }
+    
+    def _write_customers(self, result, batch):
+        rows = []
+        added = {}
+        added_ids = set()
+        for line, customer in batch:
+            existing = self.customer_ids.get(customer['name']) or added.get(customer['name'])
+            if existing:
+                # Imported before, or created here by hand: notes go to that customer
+                if existing != customer['id']:
+                    self.customer_aliases[customer['id']] = existing
+                continue
+            if customer['id'] in self.customer_names or customer['id'] in added_ids:
+                self._reject(result, line, f"Customer id {customer['id']} belongs to another customer")
+                continue
+            added[customer['name']] = customer['id']
+            added_ids.add(customer['id'])
+            rows.append((line, (customer['id'], customer['name'], customer['email'], customer['phone'],
+                                customer['address'], customer['date_created'])))
+        
+        written = set(self._insert(result, '''
+            INSERT INTO customers (id, name, email, phone, address, date_created)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', rows))
+        for line, values in rows:
+            if line in written:
+                self.customer_ids[values[1]] = values[0]
+                self.customer_names[values[0]] = values[1]
+        return len(written)
+    
+    def _parse_note(self, row):
+        for field in ('plant_name', 'condition', 'recommended_treatment', 'status'):
+            if not row.get(field):
+                raise ValueError(f'{field} is required')
+        if row['status'] not in ['healthy', 'unhealthy', 'treated']:
+            raise ValueError('Invalid status. Must be healthy, unhealthy, or treated')
+        
+        customer_id = row.get('customer_id')
+        customer_id = self.customer_aliases.get(customer_id, customer_id)
+        if customer_id not in self.customer_names:
+            customer_id = self.customer_ids.get((row.get('customer_name') or '').strip())
+        if customer_id is None:
+            raise ValueError('Customer not found')
+        
+        date_created = parse_import_date(row.get('date_created'))
+        return {
+            'id': row.get('id') or str(uuid.uuid4()),
+            'customer_id': customer_id,
+            'customer_name': self.customer_names[customer_id],
+            'plant_name': row['plant_name'],
+            'condition': row['condition'],
+            'recommended_treatment': row['recommended_treatment'],
+            'status': row['status'],
+            'date_created': date_created,
+            'date_updated': parse_import_date(row.get('date_updated')) if row.get('date_updated') else date_created
+        }
+    
+    def _write_notes(self, result, batch):
+        existing = self._existing_ids('plant_notes', (note['id'] for _, note in batch))
+        rows = []
+        for line, note in batch:
+            if note['id'] in existing:
+                continue
+            existing.add(note['id'])
+            rows.append((line, (note['id'], note['customer_id'], note['customer_name'], note['plant_name'],
+                                note['condition'], note['recommended_treatment'], note['status'],
+                                note['date_created'], note['date_updated'])))
+        
+        return len(self._insert(result, '''
+            INSERT INTO plant_notes (id, customer_id, customer_name, plant_name, condition,
+                                     recommended_treatment, status, date_created, date_updated)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows))
+    
+    def _parse_image(self, row):
+        if self.image_root is None:
+            raise ValueError('Image imports are not enabled')
+        if not row.get('note_id') or not row.get('file_path'):
+            raise ValueError('note_id and file_path are required')
+        
+        source = safe_join(self.image_root, row['file_path'])
+        if source is None or not allowed_file(source):
+            raise ValueError(f"Invalid image path {row['file_path']}")
+        if not os.path.isfile(source):
+            raise ValueError(f"Image file {row['file_path']} not found")
+        return {
+            'id': row.get('id') or str(uuid.uuid4()),
+            'note_id': row['note_id'],
+            'original_filename': row.get('original_filename') or os.path.basename(source),
+            'source': source,
+            'date_uploaded': parse_import_date(row.get('date_uploaded'))
+        }
+    
+    def _write_images(self, result, batch):
+        notes = self._existing_ids('plant_notes', (image['note_id'] for _, image in batch))
+        existing = self._existing_ids('note_images', (image['id'] for _, image in batch))
+        images = []
+        for line, image in batch:
+            if image['id'] in existing:
+                continue
+            if image['note_id'] not in notes:
+                self._reject(result, line, 'Note not found')
+                continue
+            existing.add(image['id'])
+            images.append((line, image))
+        
+        if self.copy_images:
+            # Resize and copy the batch's images into the blob store in parallel
+            futures = [(line, image, submit_job(self.pool_name, self.workers, process_image_file, image['source']))
+                       for line, image in images]
+            images = []
+            for line, image, future in futures:
+                try:
+                    blob = future.result()
+                except BrokenProcessPool:
+                    reset_process_pool(self.pool_name)
+                    raise
+                except ValueError as e:
+                    self._reject(result, line, str(e))
+                    continue
+                image['blob'] = blob
+                image.update(blob_image_fields(blob))
+                images.append((line, image))
+        else:
+            # Refer to the files where they are, as images uploaded before
+            # the blob store were
+            for _, image in images:
+                image.update({
+                    'filename': os.path.basename(image['source']),
+                    'file_path': image['source'],
+                    'file_size': os.path.getsize(image['source']),
+                    'thumbnail_filename': None,
+                    'preview_filename': None,
+                    'blob_hash': None,
+                    'blob': None
+                })
+        
+        try:
+            return self._insert_images(result, images)
+        except BlobReclaimed:
+            # An identical image was deleted, blob and all, since the batch
+            # was processed; process the images whose files went again
+            for _, image in images:
+                if image['blob'] is not None and not blob_files_exist(image['blob']):
+                    image['blob'] = process_image_file(image['source'])
+                    image.update(blob_image_fields(image['blob']))
+            return self._insert_images(result, images)
+    
+    def _insert_images(self, result, images):
+        rows = [(line, (image['id'], image['note_id'], image['filename'], image['original_filename'],
+                        image['file_path'], image['file_size'], image['date_uploaded'],
+                        image['thumbnail_filename'], image['preview_filename'], image['blob_hash']))
+                for line, image in images]
+        blobs = {image['blob']['hash']: image['blob'] for _, image in images if image['blob'] is not None}
+        return len(self._insert(result, '''
+            INSERT INTO note_images (id, note_id, filename, original_filename, file_path, file_size,
+                                     date_uploaded, thumbnail_filename, preview_filename, blob_hash)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows, list(blobs.values())))
+
+def parse_import_date(value):
+    """ISO timestamp of an imported row, defaulting to now. Raises ValueError if malformed."""
+    if not value:
+        return datetime.now().isoformat()
+    return datetime.fromisoformat(value).isoformat()
+
+def print_import_progress(result):
+    """Report progress of a bulk import on stdout"""
+    print(f"{result['file']}: {result['rows']} rows read, {result['imported']} imported, "
+          f"{result['skipped']} skipped, {result['failed']} rejected")
+
+def import_csv_directory(directory, image_root=None, copy_images=False):
+    """Import customers.csv, plant_notes.csv and note_images.csv from directory,
+    whichever exist, resizing images on every CPU when copying them"""
+    conn = get_db_connection()
+    try:
+        importer = BulkImporter(conn, image_root, copy_images, ('import', os.cpu_count()),
+                                print_import_progress)
+        for filename, load in (('customers.csv', importer.import_customers),
+                               ('plant_notes.csv', importer.import_notes),
+                               ('note_images.csv', importer.import_images)):
+            path = os.path.join(directory, filename)
+            if not os.path.exists(path):
+                continue
+            with open(path, newline='', encoding='utf-8-sig') as source:
+                result = load(source)
+            print(f"Imported {filename}: {result['imported']} of {result['rows']} rows "
+                  f"in {result['seconds']}s ({result['rows_per_second']} rows/s)")
+        summary = importer.summary()
+    finally:
+        conn.close()
+    
+    for error in summary['errors']:
+        print(f"{error['file']} line {error['line']}: {error['error']}")
+    if summary['failed'] > len(summary['errors']):
+        print(f"... and {summary['failed'] - len(summary['errors'])} more rejected rows")
+    return summary
+
+# (note_id, filename) -> (directory, expiry) of images recently confirmed to
+# exist, least recently used first. Only confirmed pairs are cached, so new
+# images need no invalidation; deletes evict their entries in this worker and
+# the expiry bounds how long other workers keep serving them.
+_upload_locations = OrderedDict()
+_upload_locations_lock = threading.Lock()
+
+def lookup_upload_location(note_id, filename):
+    """Directory of a cached image file, or None if it must be checked in the database"""
+    key = (note_id, filename)
+    with _upload_locations_lock:
+        entry = _upload_locations.get(key)
+        if entry is None:
+            return None
+        if entry[1] < time.monotonic():
+            del _upload_locations[key]
+            return None
+        _upload_locations.move_to_end(key)
+        return entry[0]
+
+def cache_upload_location(note_id, filename, directory):
+    """Remember where an image file confirmed in the database is stored"""
+    with _upload_locations_lock:
+        _upload_locations[(note_id, filename)] = (directory, time.monotonic() + UPLOAD_CACHE_TTL)
+        _upload_locations.move_to_end((note_id, filename))
+        while len(_upload_locations) > UPLOAD_CACHE_SIZE:
+            _upload_locations.popitem(last=False)
+
+def invalidate_upload_locations(note_id, filenames=None):
+    """Forget cached image files of a note, or all of them if filenames is None"""
+    with _upload_locations_lock:
+        if filenames is None:
+            for key in [key for key in _upload_locations if key[0] == note_id]:
+                del _upload_locations[key]
+        else:
+            for filename in filenames:
+                _upload_locations.pop((note_id, filename), None)
+
+def send_upload(directory, filename):
+    """Send a stored image with validators and headers that let it be cached for good"""
+    if UPLOAD_ACCEL_REDIRECT:
+        # Let the front proxy send the bytes (and handle Range itself)
+        path = os.path.relpath(os.path.abspath(os.path.join(directory, filename)),
+                               os.path.abspath(setting('UPLOAD_FOLDER')))
+        response = Response(mimetype=mimetypes.guess_type(filename)[0])
+        response.headers['X-Accel-Redirect'] = f"{UPLOAD_ACCEL_REDIRECT.rstrip('/')}/{path.replace(os.sep, '/')}"
+        response.set_etag(filename)
+        response.cache_control.public = True
+        response.cache_control.max_age = UPLOAD_MAX_AGE
+        response.make_conditional(request)
+    else:
+        # Stored files never change under a name: blobs are named after
+        # their content and other uploads after a fresh uuid
+        response = send_from_directory(directory, filename, etag=filename, conditional=True,
+                                       max_age=UPLOAD_MAX_AGE)
+    response.cache_control.immutable = True
+    return response
+
+@bp.route('/')
 def index():
     """Main dashboard page"""
     return render_template('index.html')
 
-@app.route('/uploads/<customer_id>/<note_id>/<filename>')
+@bp.route('/uploads/<customer_id>/<note_id>/<filename>')
 def uploaded_file(customer_id, note_id, filename):
     """Serve uploaded images"""
     try:
-        # Security check - ensure the file exists in our database
-        conn = get_db_connection()
-        image = conn.execute('''
-            SELECT file_path FROM note_images 
-            WHERE filename = ? AND note_id = ?
-        ''', (filename, note_id)).fetchone()
-        conn.close()
-        
-        if not image:
-            return jsonify({'error': 'Image not found'}), 404
-        
-        # Serve the file
-        directory = os.path.join(UPLOAD_FOLDER, customer_id, note_id)
-        return send_from_directory(directory, filename)
+        # Security check - ensure the file exists in our database, unless
+        # this worker has confirmed it recently
+        directory = lookup_upload_location(note_id, filename)
+        if directory is None:
+            conn = get_db()
+            image = conn.execute('''
+                SELECT file_path FROM note_images 
+                WHERE note_id = ? AND ? IN (filename, thumbnail_filename, preview_filename)
+            ''', (note_id, filename)).fetchone()
+            
+            if not image:
+                return jsonify({'error': 'Image not found'}), 404
+            
+            # Serve the file from wherever the image is stored, which is the
+            # shared blob store for processed images
+            directory = os.path.dirname(image['file_path'])
+            cache_upload_location(note_id, filename, directory)
+        
+        return send_upload(directory, filename)
+    except NotFound:
+        invalidate_upload_locations(note_id, [filename])
+        return jsonify({'error': 'Image not found'}), 404
     except Exception as e:
         print(f"Error serving file: {str(e)}")
         return jsonify({'error': 'Error serving file'}), 500
 
-@app.route('/api/notes/<note_id>/images', methods=['POST', 'DELETE'])
+@bp.route('/api/notes/<note_id>/images', methods=['GET', 'POST', 'DELETE'])
 def note_images(note_id):
     """Handle image operations for existing notes"""
-    if request.method == 'POST':
+    if request.method == 'GET':
+        # Processing status of the note's images, for polling after an upload
+        conn = get_db()
+        note = conn.execute('SELECT customer_id FROM plant_notes WHERE id = ?', (note_id,)).fetchone()
+        if not note:
+            return jsonify({'error': 'Note not found'}), 404
+        
+        images = conn.execute('''
+            SELECT id, filename, original_filename, thumbnail_filename, preview_filename,
+                   processing_state, processing_error
+            FROM note_images WHERE note_id = ? ORDER BY date_uploaded, rowid
+        ''', (note_id,)).fetchall()
+        
+        image_list = []
+        for image in images:
+            image_dict = serialize_image(note['customer_id'], note_id, image)
+            image_dict['processing_error'] = image['processing_error']
+            image_list.append(image_dict)
+        
+        return jsonify({
+            'images': image_list,
+            'pending': sum(1 for image in images if image['processing_state'] == 'processing')
+        })
+    
+    elif request.method == 'POST':
         # Add images to existing note
         files = request.files.getlist('images')
         
         if not files or not any(file.filename for file in files):
             return jsonify({'error': 'No images provided'}), 400
         
-        conn = get_db_connection()
+        conn = get_db()
         
         # Verify note exists and get customer info
         note = conn.execute('SELECT customer_id FROM plant_notes WHERE id = ?', (note_id,)).fetchone()
         if not note:
-            conn.close()
             return jsonify({'error': 'Note not found'}), 404
         
+        images = []
         try:
-            uploaded_images = []
-            upload_path = get_note_upload_path(note['customer_id'], note_id)
-            current_time = datetime.now().isoformat()
+            defer = ASYNC_IMAGE_PROCESSING and image_queue_has_room()
             
+            # Save and process files before writing, so the database write
+            # lock is not held while images are resized
             for file in files:
                 if file and file.filename and allowed_file(file.filename):
-                    # Generate unique filename
-                    file_extension = file.filename.rsplit('.', 1)[1].lower()
-                    unique_filename = f"{uuid.uuid4()}.{file_extension}"
-                    file_path = os.path.join(upload_path, unique_filename)
-                    
-                    # Save file
-                    file.save(file_path)
-                    
-                    # Resize image to reduce file size
-                    resize_image(file_path)
-                    
-                    # Get file size
-                    file_size = os.path.getsize(file_path)
-                    
+                    images.append(save_uploaded_image(conn, file, note['customer_id'], note_id, defer))
+            
+            current_time = datetime.now().isoformat()
+            
+            def write(conn):
+                for image in images:
                     # Store image info in database
-                    image_id = str(uuid.uuid4())
-                    conn.execute('''
-                        INSERT INTO note_images (id, note_id, filename, original_filename, 
-                                               file_path, file_size, date_uploaded)
-                        VALUES (?, ?, ?, ?, ?, ?, ?)
-                    ''', (image_id, note_id, unique_filename, file.filename,
-                          file_path, file_size, current_time))
-                    
-                    uploaded_images.append({
-                        'id': image_id,
-                        'filename': unique_filename,
-                        'original_filename': file.filename,
-                        'url': f"/uploads/{note['customer_id']}/{note_id}/{unique_filename}"
-                    })
+                    image['id'] = insert_note_image(conn, note_id, image, current_time)
+                
+                # Update note's date_updated
+                conn.execute('UPDATE plant_notes SET date_updated = ? WHERE id = ?', 
+                            (current_time, note_id))
             
-            # Update note's date_updated
-            conn.execute('UPDATE plant_notes SET date_updated = ? WHERE id = ?', 
-                        (current_time, note_id))
+            perform_image_write(write, images)
+            uploaded_images = [serialize_image(note['customer_id'], note_id, image) for image in images]
             
-            conn.commit()
-            conn.close()
+            for image in images:
+                if image['processing_state'] == 'processing':
+                    queue_image_processing(image['id'], image['file_path'], image['source_hash'])
             
             return jsonify({
                 'message': f'{len(uploaded_images)} images uploaded successfully',
@@ -222,7 +2911,9 @@ def note_images(note_id):
             }), 201
             
         except Exception as e:
-            conn.close()
+            discard_uploaded_images(images)
+            if isinstance(e, DatabaseBusy):
+                raise
             print(f"Error uploading images: {str(e)}")
             return jsonify({'error': 'Failed to upload images'}), 500
     
@@ -233,44 +2924,48 @@ def note_images(note_id):
         if not image_id:
             return jsonify({'error': 'Image ID required'}), 400
         
-        conn = get_db_connection()
+        conn = get_db()
         
         # Get image info
         image = conn.execute('''
-            SELECT file_path FROM note_images WHERE id = ? AND note_id = ?
+            SELECT filename, file_path, thumbnail_filename, preview_filename, blob_hash
+            FROM note_images WHERE id = ? AND note_id = ?
         ''', (image_id, note_id)).fetchone()
         
         if not image:
-            conn.close()
             return jsonify({'error': 'Image not found'}), 404
         
-        try:
-            # Delete from database
+        def write(conn):
+            # Delete from database, which drops the image's reference to its blob
             conn.execute('DELETE FROM note_images WHERE id = ?', (image_id,))
+            # Blob files no other image shares go with it
+            delete_unreferenced_blobs(conn)
             
             # Update note's date_updated
             current_time = datetime.now().isoformat()
             conn.execute('UPDATE plant_notes SET date_updated = ? WHERE id = ?', 
                         (current_time, note_id))
+        
+        try:
+            perform_write(write)
             
-            conn.commit()
-            conn.close()
+            invalidate_upload_locations(note_id, [image['filename'], image['thumbnail_filename'],
+                                                  image['preview_filename']])
             
-            # Delete file from filesystem
-            try:
-                if os.path.exists(image['file_path']):
-                    os.remove(image['file_path'])
-            except Exception as e:
-                print(f"Error deleting file {image['file_path']}: {str(e)}")
+            # Delete the files of an image stored outside the blob store
+            if image['blob_hash'] is None:
+                remove_image_files(image['file_path'],
+                                   (image['thumbnail_filename'], image['preview_filename']))
             
             return jsonify({'message': 'Image deleted successfully'})
             
+        except DatabaseBusy:
+            raise
         except Exception as e:
-            conn.close()
             print(f"Error deleting image: {str(e)}")
             return jsonify({'error': 'Failed to delete image'}), 500
 
-@app.route('/api/customers', methods=['GET', 'POST'])
+@bp.route('/api/customers', methods=['GET', 'POST'])
 def customers():
     """Handle customer operations"""
     if request.method == 'POST':
@@ -282,14 +2977,12 @@ def customers():
         customer_id = str(uuid.uuid4())
         date_created = datetime.now().isoformat()
         
-        conn = get_db_connection()
         try:
-            conn.execute('''
+            perform_write(lambda conn: conn.execute('''
                 INSERT INTO customers (id, name, email, phone, address, date_created)
                 VALUES (?, ?, ?, ?, ?, ?)
             ''', (customer_id, data['name'], data.get('email'), 
-                  data.get('phone'), data.get('address'), date_created))
-            conn.commit()
+                  data.get('phone'), data.get('address'), date_created)))
             
             customer = {
                 'id': customer_id,
@@ -304,28 +2997,92 @@ def customers():
             
         except sqlite3.IntegrityError:
             return jsonify({'error': 'Customer name already exists'}), 400
-        finally:
-            conn.close()
     
     else:  # GET
-        conn = get_db_connection()
-        customers = conn.execute('SELECT * FROM customers ORDER BY name').fetchall()
-        conn.close()
+        conn = get_db()
+        
+        # Typeahead: a capped, ranked list of the customers matching a prefix
+        prefix = request.args.get('prefix')
+        if prefix is not None:
+            limit = request.args.get('limit', TYPEAHEAD_LIMIT, type=int)
+            if limit < 1 or limit > TYPEAHEAD_MAX_LIMIT:
+                return jsonify({'error': f'Limit must be between 1 and {TYPEAHEAD_MAX_LIMIT}'}), 400
+            
+            # Note counts change with the notes
+            etag = revision_etag(conn, 'customers', 'notes')
+            if request.if_none_match.contains(etag):
+                return not_modified(etag)
+            return tag_response(jsonify({'customers': search_customers(conn, prefix.strip(), limit)}), etag)
         
-        return jsonify([dict(customer) for customer in customers])
+        try:
+            limit, after, stream = parse_page_args(2)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        etag = revision_etag(conn, 'customers')
+        if request.if_none_match.contains(etag):
+            return not_modified(etag)
+        
+        query = 'SELECT * FROM customers'
+        params = []
+        if after:
+            query += ' WHERE (name, id) > (?, ?)'
+            params.extend(after)
+        query += ' ORDER BY name, id'
+        
+        if stream:
+            if limit:
+                query += f' LIMIT {limit}'
+            return tag_response(stream_json_rows(query, params,
+                                                 lambda conn, rows: [dict(row) for row in rows]), etag)
+        
+        if limit is None:
+            customers = conn.execute(query, params).fetchall()
+            return tag_response(jsonify([dict(customer) for customer in customers]), etag)
+        
+        customers, next_cursor = paginate(conn, query, params, limit, ('name', 'id'))
+        
+        return tag_response(jsonify({
+            'customers': [dict(customer) for customer in customers],
+            'next_cursor': next_cursor
+        }), etag)
 
-@app.route('/api/customers/<customer_id>')
+@bp.route('/api/customers/<customer_id>')
 def get_customer(customer_id):
     """Get specific customer by ID"""
-    conn = get_db_connection()
+    conn = get_db()
     customer = conn.execute('SELECT * FROM customers WHERE id = ?', (customer_id,)).fetchone()
-    conn.close()
     
     if customer:
         return jsonify(dict(customer))
     return jsonify({'error': 'Customer not found'}), 404
 
-@app.route('/api/notes', methods=['GET', 'POST'])
+@bp.route('/api/stats')
+def stats():
+    """Note counts by status and last activity across all customers"""
+    conn = get_db()
+    etag = revision_etag(conn, 'notes')
+    if request.if_none_match.contains(etag):
+        return not_modified(etag)
+    
+    return tag_response(jsonify(get_status_summary(conn, 'all')), etag)
+
+@bp.route('/api/customers/<customer_id>/stats')
+def customer_stats(customer_id):
+    """Note counts by status and last activity of a customer"""
+    conn = get_db()
+    etag = revision_etag(conn, f'customer:{customer_id}')
+    if request.if_none_match.contains(etag):
+        return not_modified(etag)
+    
+    if not conn.execute('SELECT 1 FROM customers WHERE id = ?', (customer_id,)).fetchone():
+        return jsonify({'error': 'Customer not found'}), 404
+    
+    summary = get_status_summary(conn, customer_id)
+    summary['customer_id'] = customer_id
+    return tag_response(jsonify(summary), etag)
+
+@bp.route('/api/notes', methods=['GET', 'POST'])
 def notes():
     """Handle plant notes operations"""
     if request.method == 'POST':
@@ -352,64 +3109,44 @@ def notes():
             return jsonify({'error': 'Invalid status. Must be healthy, unhealthy, or treated'}), 400
         
         # Verify customer exists and get customer name
-        conn = get_db_connection()
+        conn = get_db()
         customer = conn.execute('SELECT name FROM customers WHERE id = ?', (data['customer_id'],)).fetchone()
         
         if not customer:
-            conn.close()
             return jsonify({'error': 'Customer not found'}), 404
         
         note_id = str(uuid.uuid4())
         current_time = datetime.now().isoformat()
+        images = []
         
         try:
-            # Insert the note
-            conn.execute('''
-                INSERT INTO plant_notes (id, customer_id, customer_name, plant_name, condition, 
-                                       recommended_treatment, status, date_created, date_updated)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (note_id, data['customer_id'], customer['name'], data['plant_name'],
-                  data['condition'], data['recommended_treatment'], data['status'],
-                  current_time, current_time))
-            
-            # Handle file uploads
-            uploaded_images = []
-            if files:
-                upload_path = get_note_upload_path(data['customer_id'], note_id)
+            # Handle file uploads before writing, so the database write lock
+            # is not held while images are resized
+            defer = ASYNC_IMAGE_PROCESSING and image_queue_has_room()
+            for file in files:
+                if file and file.filename and allowed_file(file.filename):
+                    images.append(save_uploaded_image(conn, file, data['customer_id'], note_id, defer))
+            
+            def write(conn):
+                # Insert the note
+                conn.execute('''
+                    INSERT INTO plant_notes (id, customer_id, customer_name, plant_name, condition, 
+                                           recommended_treatment, status, date_created, date_updated)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (note_id, data['customer_id'], customer['name'], data['plant_name'],
+                      data['condition'], data['recommended_treatment'], data['status'],
+                      current_time, current_time))
                 
-                for file in files:
-                    if file and file.filename and allowed_file(file.filename):
-                        # Generate unique filename
-                        file_extension = file.filename.rsplit('.', 1)[1].lower()
-                        unique_filename = f"{uuid.uuid4()}.{file_extension}"
-                        file_path = os.path.join(upload_path, unique_filename)
-                        
-                        # Save file
-                        file.save(file_path)
-                        
-                        # Resize image to reduce file size
-                        resize_image(file_path)
-                        
-                        # Get file size
-                        file_size = os.path.getsize(file_path)
-                        
-                        # Store image info in database
-                        image_id = str(uuid.uuid4())
-                        conn.execute('''
-                            INSERT INTO note_images (id, note_id, filename, original_filename, 
-                                                   file_path, file_size, date_uploaded)
-                            VALUES (?, ?, ?, ?, ?, ?, ?)
-                        ''', (image_id, note_id, unique_filename, file.filename,
-                              file_path, file_size, current_time))
-                        
-                        uploaded_images.append({
-                            'id': image_id,
-                            'filename': unique_filename,
-                            'original_filename': file.filename,
-                            'url': f"/uploads/{data['customer_id']}/{note_id}/{unique_filename}"
-                        })
+                for image in images:
+                    # Store image info in database
+                    image['id'] = insert_note_image(conn, note_id, image, current_time)
             
-            conn.commit()
+            perform_image_write(write, images)
+            uploaded_images = [serialize_image(data['customer_id'], note_id, image) for image in images]
+            
+            for image in images:
+                if image['processing_state'] == 'processing':
+                    queue_image_processing(image['id'], image['file_path'], image['source_hash'])
             
             note = {
                 'id': note_id,
@@ -428,110 +3165,353 @@ def notes():
             
         except Exception as e:
             # Cleanup uploaded files if database insert fails
-            if 'upload_path' in locals():
+            discard_uploaded_images(images)
+            upload_path = os.path.join(setting('UPLOAD_FOLDER'), data['customer_id'], note_id)
+            if os.path.exists(upload_path):
                 try:
                     shutil.rmtree(upload_path)
                 except:
                     pass
+            if isinstance(e, DatabaseBusy):
+                raise
             print(f"Error creating note: {str(e)}")
             return jsonify({'error': 'Failed to create note'}), 500
-        finally:
-            conn.close()
     
     else:  # GET
         customer_id = request.args.get('customer_id')
         status = request.args.get('status')
         
-        conn = get_db_connection()
+        try:
+            limit, after, stream = parse_page_args(2)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        conditions = []
+        params = []
+        if customer_id:
+            conditions.append('customer_id = ?')
+            params.append(customer_id)
+        if status:
+            conditions.append('status = ?')
+            params.append(status)
+        if after:
+            conditions.append('(date_created, id) < (?, ?)')
+            params.extend(after)
+        
+        query = 'SELECT * FROM plant_notes'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY date_created DESC, id DESC'
+        
+        conn = get_db()
+        # A customer's notes only change with that customer's revision
+        etag = revision_etag(conn, f'customer:{customer_id}' if customer_id else 'notes')
+        if request.if_none_match.contains(etag):
+            return not_modified(etag)
+        
+        if stream:
+            if limit:
+                query += f' LIMIT {limit}'
+            return tag_response(stream_json_rows(query, params, hydrate_notes), etag)
+        
+        if limit is None:
+            notes = conn.execute(query, params).fetchall()
+            notes_with_images = hydrate_notes(conn, notes)
+            return tag_response(jsonify(notes_with_images), etag)
+        
+        notes, next_cursor = paginate(conn, query, params, limit, ('date_created', 'id'))
+        notes_with_images = hydrate_notes(conn, notes)
+        
+        return tag_response(jsonify({
+            'notes': notes_with_images,
+            'next_cursor': next_cursor
+        }), etag)
+
+def check_batch_items(items):
+    """Error response if items is not a non-empty list within NOTE_BATCH_LIMIT"""
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'A non-empty list of notes is required'}), 400
+    if len(items) > NOTE_BATCH_LIMIT:
+        return jsonify({'error': f'At most {NOTE_BATCH_LIMIT} notes per batch'}), 400
+    return None
+
+def batch_errors_response(errors):
+    """400 response listing the invalid items of a batch by index"""
+    return jsonify({'error': 'Invalid notes, nothing was saved', 'errors': errors}), 400
+
+def create_notes_batch(items):
+    """Insert a validated batch of notes and their uploaded images"""
+    error = check_batch_items(items)
+    if error:
+        return error
+    
+    conn = get_db()
+    required_fields = ['customer_id', 'plant_name', 'condition', 'recommended_treatment', 'status']
+    customer_ids = {item.get('customer_id') for item in items
+                    if isinstance(item, dict) and isinstance(item.get('customer_id'), str)}
+    customers = dict(conn.execute(
+        'SELECT id, name FROM customers WHERE id IN (SELECT value FROM json_each(?))',
+        (json.dumps(list(customer_ids)),)).fetchall())
+    
+    errors = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not all(item.get(field) for field in required_fields):
+            errors.append({'index': index, 'error': 'Missing required fields'})
+        elif item['status'] not in ['healthy', 'unhealthy', 'treated']:
+            errors.append({'index': index, 'error': 'Invalid status. Must be healthy, unhealthy, or treated'})
+        elif not isinstance(item['customer_id'], str) or item['customer_id'] not in customers:
+            errors.append({'index': index, 'error': 'Customer not found'})
+    if errors:
+        return batch_errors_response(errors)
+    
+    current_time = datetime.now().isoformat()
+    notes = [{
+        'id': str(uuid.uuid4()),
+        'customer_id': item['customer_id'],
+        'customer_name': customers[item['customer_id']],
+        'plant_name': item['plant_name'],
+        'condition': item['condition'],
+        'recommended_treatment': item['recommended_treatment'],
+        'status': item['status'],
+        'date_created': current_time,
+        'date_updated': current_time,
+        'images': []
+    } for item in items]
+    images = []
+    
+    try:
+        # Save images before writing, so the write lock is not held while
+        # they are resized
+        defer = ASYNC_IMAGE_PROCESSING and image_queue_has_room()
+        for index, note in enumerate(notes):
+            for file in request.files.getlist(f'images[{index}]'):
+                if file and file.filename and allowed_file(file.filename):
+                    image = save_uploaded_image(conn, file, note['customer_id'], note['id'], defer)
+                    images.append((note, image))
         
-        if customer_id and status:
-            # Get notes for specific customer with specific status
-            notes = conn.execute('''
-                SELECT * FROM plant_notes 
-                WHERE customer_id = ? AND status = ? 
-                ORDER BY date_created DESC
-            ''', (customer_id, status)).fetchall()
-        elif customer_id:
-            # Get all notes for specific customer
-            notes = conn.execute('''
-                SELECT * FROM plant_notes 
-                WHERE customer_id = ? 
-                ORDER BY date_created DESC
-            ''', (customer_id,)).fetchall()
-        else:
-            # Get all notes
-            notes = conn.execute('''
-                SELECT * FROM plant_notes 
-                ORDER BY date_created DESC
-            ''').fetchall()
-        
-        # Get images for each note
-        notes_with_images = []
-        for note in notes:
-            note_dict = dict(note)
-            
-            # Get images for this note
-            images = conn.execute('''
-                SELECT id, filename, original_filename FROM note_images 
-                WHERE note_id = ? ORDER BY date_uploaded
-            ''', (note['id'],)).fetchall()
-            
-            note_dict['images'] = [
-                {
-                    'id': img['id'],
-                    'filename': img['filename'],
-                    'original_filename': img['original_filename'],
-                    'url': f"/uploads/{note['customer_id']}/{note['id']}/{img['filename']}"
-                }
-                for img in images
-            ]
+        def write(conn):
+            conn.executemany('''
+                INSERT INTO plant_notes (id, customer_id, customer_name, plant_name, condition, 
+                                       recommended_treatment, status, date_created, date_updated)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [(note['id'], note['customer_id'], note['customer_name'], note['plant_name'],
+                   note['condition'], note['recommended_treatment'], note['status'],
+                   current_time, current_time) for note in notes])
             
-            notes_with_images.append(note_dict)
+            # Built afresh on every attempt, since a locked write is retried
+            created = [dict(note, images=[]) for note in notes]
+            by_id = {note['id']: note for note in created}
+            for note, image in images:
+                image['id'] = insert_note_image(conn, note['id'], image, current_time)
+                by_id[note['id']]['images'].append(serialize_image(note['customer_id'], note['id'], image))
+            return created
         
-        conn.close()
-        return jsonify(notes_with_images)
+        created = perform_image_write(write, [image for _, image in images])
+        
+        for _, image in images:
+            if image['processing_state'] == 'processing':
+                queue_image_processing(image['id'], image['file_path'], image['source_hash'])
+        
+        return jsonify({'notes': created}), 201
+        
+    except Exception as e:
+        # Cleanup uploaded files if the batch could not be written
+        discard_uploaded_images([image for _, image in images])
+        for note in notes:
+            upload_path = os.path.join(setting('UPLOAD_FOLDER'), note['customer_id'], note['id'])
+            if os.path.exists(upload_path):
+                shutil.rmtree(upload_path, ignore_errors=True)
+        if isinstance(e, DatabaseBusy):
+            raise
+        print(f"Error creating notes: {str(e)}")
+        return jsonify({'error': 'Failed to create notes'}), 500
+
+def update_notes_batch(updates):
+    """Apply a validated batch of note updates"""
+    error = check_batch_items(updates)
+    if error:
+        return error
+    
+    conn = get_db()
+    note_ids = [update.get('id') for update in updates
+                if isinstance(update, dict) and isinstance(update.get('id'), str)]
+    existing = {row['id'] for row in conn.execute(
+        'SELECT id FROM plant_notes WHERE id IN (SELECT value FROM json_each(?))',
+        (json.dumps(note_ids),))}
+    
+    errors = []
+    seen = set()
+    # Updates setting the same fields run as one executemany()
+    groups = {}
+    for index, update in enumerate(updates):
+        if not isinstance(update, dict) or not isinstance(update.get('id'), str) or not update['id']:
+            errors.append({'index': index, 'error': 'Note id is required'})
+            continue
+        fields = tuple(field for field in ['plant_name', 'condition', 'recommended_treatment', 'status']
+                       if field in update)
+        if update['id'] in seen:
+            errors.append({'index': index, 'error': 'Note is updated twice'})
+        elif update['id'] not in existing:
+            errors.append({'index': index, 'error': 'Note not found'})
+        elif not fields:
+            errors.append({'index': index, 'error': 'No valid fields to update'})
+        elif not all(isinstance(update[field], str) for field in fields):
+            errors.append({'index': index, 'error': 'Fields must be strings'})
+        elif 'plant_name' in update and not update['plant_name']:
+            errors.append({'index': index, 'error': 'Plant name cannot be empty'})
+        elif 'status' in update and update['status'] not in ['healthy', 'unhealthy', 'treated']:
+            errors.append({'index': index, 'error': 'Invalid status'})
+        else:
+            groups.setdefault(fields, []).append(update)
+        seen.add(update['id'])
+    if errors:
+        return batch_errors_response(errors)
+    
+    current_time = datetime.now().isoformat()
+    ids = [update['id'] for update in updates]
+    
+    def write(conn):
+        for fields, group in groups.items():
+            assignments = ', '.join(f'{field} = ?' for field in fields)
+            conn.executemany(f'UPDATE plant_notes SET {assignments}, date_updated = ? WHERE id = ?',
+                             [[update[field] for field in fields] + [current_time, update['id']]
+                              for update in group])
+        
+        # Return the updated notes with images, in the order they were given
+        rows = conn.execute('SELECT * FROM plant_notes WHERE id IN (SELECT value FROM json_each(?))',
+                            (json.dumps(ids),)).fetchall()
+        notes_by_id = {note['id']: note for note in hydrate_notes(conn, rows)}
+        return [notes_by_id[note_id] for note_id in ids if note_id in notes_by_id]
+    
+    try:
+        updated = perform_write(write)
+    except DatabaseBusy:
+        raise
+    except Exception as e:
+        print(f"Error updating notes: {str(e)}")
+        return jsonify({'error': 'Failed to update notes'}), 500
+    
+    return jsonify({'notes': updated})
+
+@bp.route('/api/notes/batch', methods=['POST', 'PUT'])
+def notes_batch():
+    """Create or update many notes in one transaction.
+
+    POST takes a list of notes, as JSON ({"notes": [...]}) or as multipart
+    form data with the list in the notes field and each note's images in
+    images[<index>]. PUT takes {"updates": [{"id": ..., <fields>}, ...]}, or
+    {"ids": [...], "changes": {<fields>}} to make the same change to many
+    notes. Every item is validated before anything is written; if any item
+    is invalid, nothing is and the errors are returned by item index.
+    """
+    if request.method == 'POST':
+        if request.is_json:
+            data = request.get_json()
+            items = data.get('notes') if isinstance(data, dict) else data
+        else:
+            try:
+                items = json.loads(request.form.get('notes', ''))
+            except ValueError:
+                items = None
+        return create_notes_batch(items)
+    
+    data = request.get_json(silent=True)
+    if isinstance(data, dict) and 'ids' in data:
+        changes = data.get('changes')
+        if not isinstance(data['ids'], list) or not isinstance(changes, dict):
+            return jsonify({'error': 'ids must be a list and changes an object'}), 400
+        updates = [dict(changes, id=note_id) for note_id in data['ids']]
+    else:
+        updates = data.get('updates') if isinstance(data, dict) else None
+    return update_notes_batch(updates)
+
+@bp.route('/api/notes/search')
+def search_notes():
+    """Full-text search over notes, best matches first"""
+    match = build_search_query(request.args.get('q', ''))
+    if not match:
+        return jsonify({'error': 'Search query required'}), 400
+    
+    customer_id = request.args.get('customer_id')
+    status = request.args.get('status')
+    
+    try:
+        limit, after, _ = parse_page_args(2)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    conditions = ['notes_fts MATCH ?']
+    params = [match]
+    if customer_id:
+        conditions.append('n.customer_id = ?')
+        params.append(customer_id)
+    if status:
+        conditions.append('n.status = ?')
+        params.append(status)
+    
+    weights = ', '.join(str(weight) for weight in SEARCH_COLUMN_WEIGHTS.values())
+    # bm25() is lower for better matches; id breaks ties so pages are stable
+    query = f'''
+        SELECT * FROM (
+            SELECT n.*, bm25(notes_fts, {weights}) AS rank,
+                   snippet(notes_fts, -1, ?, ?, '…', {SNIPPET_TOKENS}) AS snippet
+            FROM notes_fts JOIN plant_notes n ON n.rowid = notes_fts.rowid
+            WHERE {' AND '.join(conditions)}
+        )
+    '''
+    params = [SNIPPET_OPEN, SNIPPET_CLOSE] + params
+    if after:
+        query += ' WHERE (rank, id) > (?, ?)'
+        params.extend(after)
+    query += ' ORDER BY rank, id'
+    
+    conn = get_db()
+    etag = revision_etag(conn, f'customer:{customer_id}' if customer_id else 'notes')
+    if request.if_none_match.contains(etag):
+        return not_modified(etag)
+    
+    try:
+        notes, next_cursor = paginate(conn, query, params, limit or DEFAULT_PAGE_LIMIT, ('rank', 'id'))
+    except sqlite3.OperationalError as e:
+        print(f"Error searching notes: {str(e)}")
+        return jsonify({'error': 'Invalid search query'}), 400
+    
+    results = hydrate_notes(conn, notes)
+    for result, note in zip(results, notes):
+        result.pop('rank', None)
+        result['snippet'] = render_snippet(note['snippet'])
+    
+    return tag_response(jsonify({
+        'notes': results,
+        'next_cursor': next_cursor
+    }), etag)
 
-@app.route('/api/notes/<note_id>', methods=['GET', 'PUT', 'DELETE'])
+@bp.route('/api/notes/<note_id>', methods=['GET', 'PUT', 'DELETE'])
 def note_detail(note_id):
     """Handle individual note operations"""
-    conn = get_db_connection()
+    conn = get_db()
     
     if request.method == 'GET':
+        etag = revision_etag(conn, 'notes')
+        if request.if_none_match.contains(etag):
+            return not_modified(etag)
+        
         note = conn.execute('SELECT * FROM plant_notes WHERE id = ?', (note_id,)).fetchone()
         
         if not note:
-            conn.close()
             return jsonify({'error': 'Note not found'}), 404
         
-        # Get images for this note
-        images = conn.execute('''
-            SELECT id, filename, original_filename FROM note_images 
-            WHERE note_id = ? ORDER BY date_uploaded
-        ''', (note_id,)).fetchall()
-        
-        note_dict = dict(note)
-        note_dict['images'] = [
-            {
-                'id': img['id'],
-                'filename': img['filename'],
-                'original_filename': img['original_filename'],
-                'url': f"/uploads/{note['customer_id']}/{note['id']}/{img['filename']}"
-            }
-            for img in images
-        ]
+        note_dict = hydrate_notes(conn, [note])[0]
         
-        conn.close()
-        return jsonify(note_dict)
+        return tag_response(jsonify(note_dict), etag)
     
     elif request.method == 'PUT':
         data = request.get_json()
         
         if not data:
-            conn.close()
             return jsonify({'error': 'No data provided'}), 400
         
         if 'status' in data and data['status'] not in ['healthy', 'unhealthy', 'treated']:
-            conn.close()
             return jsonify({'error': 'Invalid status'}), 400
         
         # Build update query dynamically
@@ -544,7 +3524,6 @@ def note_detail(note_id):
                 values.append(data[field])
         
         if not update_fields:
-            conn.close()
             return jsonify({'error': 'No valid fields to update'}), 400
         
         update_fields.append('date_updated = ?')
@@ -553,35 +3532,16 @@ def note_detail(note_id):
         
         query = f'UPDATE plant_notes SET {", ".join(update_fields)} WHERE id = ?'
         
-        cursor = conn.execute(query, values)
+        updated = perform_write(lambda conn: conn.execute(query, values).rowcount)
         
-        if cursor.rowcount == 0:
-            conn.close()
+        if updated == 0:
             return jsonify({'error': 'Note not found'}), 404
         
-        conn.commit()
-        
         # Return updated note with images
         updated_note = conn.execute('SELECT * FROM plant_notes WHERE id = ?', (note_id,)).fetchone()
         
-        # Get images for this note
-        images = conn.execute('''
-            SELECT id, filename, original_filename FROM note_images 
-            WHERE note_id = ? ORDER BY date_uploaded
-        ''', (note_id,)).fetchall()
-        
-        note_dict = dict(updated_note)
-        note_dict['images'] = [
-            {
-                'id': img['id'],
-                'filename': img['filename'],
-                'original_filename': img['original_filename'],
-                'url': f"/uploads/{updated_note['customer_id']}/{updated_note['id']}/{img['filename']}"
-            }
-            for img in images
-        ]
+        note_dict = hydrate_notes(conn, [updated_note])[0]
         
-        conn.close()
         return jsonify(note_dict)
     
     elif request.method == 'DELETE':
@@ -589,17 +3549,20 @@ def note_detail(note_id):
         note = conn.execute('SELECT customer_id FROM plant_notes WHERE id = ?', (note_id,)).fetchone()
         
         if not note:
-            conn.close()
             return jsonify({'error': 'Note not found'}), 404
         
-        # Delete the note (images will be deleted via CASCADE)
-        cursor = conn.execute('DELETE FROM plant_notes WHERE id = ?', (note_id,))
-        conn.commit()
-        conn.close()
+        def write(conn):
+            # Delete the note (images will be deleted via CASCADE, releasing
+            # their blobs)
+            conn.execute('DELETE FROM plant_notes WHERE id = ?', (note_id,))
+            delete_unreferenced_blobs(conn)
         
-        # Clean up uploaded files
+        perform_write(write)
+        invalidate_upload_locations(note_id)
+        
+        # Clean up uploaded files no other note shares
         try:
-            upload_path = os.path.join(UPLOAD_FOLDER, note['customer_id'], note_id)
+            upload_path = os.path.join(setting('UPLOAD_FOLDER'), note['customer_id'], note_id)
             if os.path.exists(upload_path):
                 shutil.rmtree(upload_path)
         except Exception as e:
@@ -607,22 +3570,24 @@ def note_detail(note_id):
         
         return jsonify({'message': 'Note deleted successfully'})
 
-@app.route('/api/customers/<customer_id>/notes')
+@bp.route('/api/customers/<customer_id>/notes')
 def customer_notes(customer_id):
     """Get all notes for a specific customer"""
     status = request.args.get('status')
     
-    conn = get_db_connection()
+    conn = get_db()
+    # The customer's name comes with the notes
+    etag = revision_etag(conn, 'customers', f'customer:{customer_id}')
+    if request.if_none_match.contains(etag):
+        return not_modified(etag)
     
     # Verify customer exists
     customer = conn.execute('SELECT name FROM customers WHERE id = ?', (customer_id,)).fetchone()
     if not customer:
-        conn.close()
         return jsonify({'error': 'Customer not found'}), 404
     
     if status:
         if status not in ['healthy', 'unhealthy', 'treated']:
-            conn.close()
             return jsonify({'error': 'Invalid status'}), 400
         
         notes = conn.execute('''
@@ -637,227 +3602,256 @@ def customer_notes(customer_id):
             ORDER BY date_created DESC
         ''', (customer_id,)).fetchall()
     
-    # Get images for each note
-    notes_with_images = []
-    for note in notes:
-        note_dict = dict(note)
-        
-        # Get images for this note
-        images = conn.execute('''
-            SELECT id, filename, original_filename FROM note_images 
-            WHERE note_id = ? ORDER BY date_uploaded
-        ''', (note['id'],)).fetchall()
-        
-        note_dict['images'] = [
-            {
-                'id': img['id'],
-                'filename': img['filename'],
-                'original_filename': img['original_filename'],
-                'url': f"/uploads/{note['customer_id']}/{note['id']}/{img['filename']}"
-            }
-            for img in images
-        ]
-        
-        notes_with_images.append(note_dict)
-    
-    conn.close()
+    notes_with_images = hydrate_notes(conn, notes)
     
-    return jsonify({
+    return tag_response(jsonify({
         'customer_name': customer['name'],
         'notes': notes_with_images
-    })
+    }), etag)
 
-@app.route('/api/customers/<customer_id>/report')
+@bp.route('/api/customers/<customer_id>/report')
 def generate_customer_report(customer_id):
     """Generate PDF report for a specific customer"""
     try:
-        conn = get_db_connection()
+        conn = get_db()
         
         # Get customer information
         customer = conn.execute('SELECT * FROM customers WHERE id = ?', (customer_id,)).fetchone()
         if not customer:
-            conn.close()
             return jsonify({'error': 'Customer not found'}), 404
         
-        # Get all notes for the customer
-        notes = conn.execute('''
-            SELECT * FROM plant_notes 
-            WHERE customer_id = ? 
-            ORDER BY date_created DESC
-        ''', (customer_id,)).fetchall()
-        
-        conn.close()
-        
-        # Generate PDF
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=72, leftMargin=72, 
-                              topMargin=72, bottomMargin=18)
-        
-        # Container for the 'Flowable' objects
-        elements = []
-        
-        # Define styles
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=24,
-            spaceAfter=30,
-            alignment=TA_CENTER,
-            textColor=colors.HexColor('#2563eb')
-        )
-        
-        heading_style = ParagraphStyle(
-            'CustomHeading',
-            parent=styles['Heading2'],
-            fontSize=16,
-            spaceAfter=12,
-            spaceBefore=20,
-            textColor=colors.HexColor('#1f2937')
-        )
-        
-        normal_style = ParagraphStyle(
-            'CustomNormal',
-            parent=styles['Normal'],
-            fontSize=11,
-            spaceAfter=6,
-            textColor=colors.HexColor('#374151')
-        )
-        
-        # Title
-        title = Paragraph("Plant Care Report", title_style)
-        elements.append(title)
-        elements.append(Spacer(1, 20))
-        
-        # Customer Information
-        customer_heading = Paragraph("Customer Information", heading_style)
-        elements.append(customer_heading)
-        
-        customer_data = [
-            ['Name:', customer['name']],
-            ['Email:', customer['email'] or 'Not provided'],
-            ['Phone:', customer['phone'] or 'Not provided'],
-            ['Address:', customer['address'] or 'Not provided'],
-            ['Customer Since:', datetime.fromisoformat(customer['date_created']).strftime('%B %d, %Y')]
-        ]
-        
-        customer_table = Table(customer_data, colWidths=[1.5*inch, 4*inch])
-        customer_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-            ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 11),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-            ('TOPPADDING', (0, 0), (-1, -1), 4),
-        ]))
-        
-        elements.append(customer_table)
-        elements.append(Spacer(1, 30))
-        
-        # Plant Care Notes
-        notes_heading = Paragraph("Plant Care Notes", heading_style)
-        elements.append(notes_heading)
-        
-        if not notes:
-            no_notes = Paragraph("No plant care notes found for this customer.", normal_style)
-            elements.append(no_notes)
-        else:
-            # Summary statistics
-            total_notes = len(notes)
-            healthy_count = sum(1 for note in notes if note['status'] == 'healthy')
-            unhealthy_count = sum(1 for note in notes if note['status'] == 'unhealthy')
-            treated_count = sum(1 for note in notes if note['status'] == 'treated')
-            
-            summary_text = f"Total Plants: {total_notes} | Healthy: {healthy_count} | Unhealthy: {unhealthy_count} | Treated: {treated_count}"
-            summary = Paragraph(summary_text, normal_style)
-            elements.append(summary)
-            elements.append(Spacer(1, 20))
-            
-            # Individual notes (images are excluded from reports as requested)
-            for i, note in enumerate(notes):
-                # Note header
-                note_title = f"{note['plant_name']} - {note['status'].title()}"
-                note_heading = Paragraph(f"<b>{note_title}</b>", normal_style)
-                elements.append(note_heading)
-                
-                # Note details
-                note_data = [
-                    ['Date:', datetime.fromisoformat(note['date_created']).strftime('%B %d, %Y')],
-                    ['Status:', note['status'].title()],
-                    ['Condition:', note['condition']],
-                    ['Treatment:', note['recommended_treatment']]
-                ]
-                
-                if note['date_updated'] != note['date_created']:
-                    note_data.append(['Last Updated:', datetime.fromisoformat(note['date_updated']).strftime('%B %d, %Y')])
-                
-                note_table = Table(note_data, colWidths=[1.2*inch, 4.3*inch])
-                
-                # Status-based coloring
-                status_color = colors.HexColor('#10b981') if note['status'] == 'healthy' else \
-                              colors.HexColor('#ef4444') if note['status'] == 'unhealthy' else \
-                              colors.HexColor('#3b82f6')
-                
-                note_table.setStyle(TableStyle([
-                    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                    ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-                    ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-                    ('FONTSIZE', (0, 0), (-1, -1), 10),
-                    ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-                    ('TOPPADDING', (0, 0), (-1, -1), 4),
-                    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                    ('BACKGROUND', (0, 1), (0, 1), status_color),
-                    ('TEXTCOLOR', (0, 1), (0, 1), colors.white),
-                    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-                ]))
-                
-                elements.append(note_table)
-                
-                # Add space between notes
-                if i < len(notes) - 1:
-                    elements.append(Spacer(1, 20))
-        
-        # Footer
-        elements.append(Spacer(1, 30))
-        footer_text = f"Report generated on {datetime.now().strftime('%B %d, %Y at %I:%M %p')}"
-        footer = Paragraph(footer_text, ParagraphStyle(
-            'Footer',
-            parent=styles['Normal'],
-            fontSize=9,
-            alignment=TA_CENTER,
-            textColor=colors.grey
-        ))
-        elements.append(footer)
+        # Reports are cached on disk until the customer's notes change
+        note_count, fingerprint = report_fingerprint(conn, customer_id)
+        file_path = get_report_cache_path(customer_id, fingerprint)
         
-        # Build PDF
-        doc.build(elements)
+        # Large reports are laid out by a report worker; poll the job instead
+        if note_count > REPORT_JOB_THRESHOLD and not os.path.exists(file_path):
+            job = start_report_job(conn, customer_id)
+            response = jsonify(serialize_report_job(job))
+            response.status_code = 202
+            response.headers['Location'] = f"/api/report-jobs/{job['id']}"
+            return response
         
-        # Get PDF data
-        pdf_data = buffer.getvalue()
-        buffer.close()
+        get_customer_report(conn, customer, file_path)
         
-        # Create response
-        response = send_file(
-            BytesIO(pdf_data),
+        return send_file(
+            file_path,
             mimetype='application/pdf',
             as_attachment=True,
             download_name=f"plant_care_report_{customer['name'].replace(' ', '_')}.pdf"
         )
         
-        return response
-        
     except Exception as e:
         print(f"Error generating PDF report: {str(e)}")
         return jsonify({'error': 'Failed to generate report'}), 500
 
-@app.errorhandler(404)
+@bp.route('/api/customers/<customer_id>/report/jobs', methods=['POST'])
+def create_report_job(customer_id):
+    """Start generating a customer's PDF report in the background"""
+    conn = get_db()
+    customer = conn.execute('SELECT id FROM customers WHERE id = ?', (customer_id,)).fetchone()
+    if not customer:
+        return jsonify({'error': 'Customer not found'}), 404
+    
+    job = start_report_job(conn, customer_id)
+    response = jsonify(serialize_report_job(job))
+    response.status_code = 202
+    response.headers['Location'] = f"/api/report-jobs/{job['id']}"
+    return response
+
+@bp.route('/api/report-jobs/<job_id>')
+def report_job_status(job_id):
+    """State of a report job"""
+    job = get_report_job(get_db(), job_id)
+    if not job:
+        return jsonify({'error': 'Report job not found'}), 404
+    
+    return jsonify(serialize_report_job(job))
+
+@bp.route('/api/report-jobs/<job_id>/download')
+def download_report_job(job_id):
+    """Download the PDF produced by a finished report job"""
+    conn = get_db()
+    job = conn.execute('''
+        SELECT j.state, j.file_path, c.name FROM report_jobs j
+        JOIN customers c ON c.id = j.customer_id
+        WHERE j.id = ?
+    ''', (job_id,)).fetchone()
+    
+    if not job:
+        return jsonify({'error': 'Report job not found'}), 404
+    if job['state'] != 'ready':
+        return jsonify({'error': 'Report is not ready', 'state': job['state']}), 409
+    if not os.path.exists(job['file_path']):
+        # Evicted from the report cache, or superseded by a newer report
+        return jsonify({'error': 'Report has expired, please generate it again'}), 410
+    
+    return send_file(
+        job['file_path'],
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=f"plant_care_report_{job['name'].replace(' ', '_')}.pdf"
+    )
+
+@bp.route('/api/reports/export')
+def export_reports_zip():
+    """Stream a ZIP archive with the reports of all customers, or of the given customer_ids"""
+    conn = get_db()
+    customers = select_export_customers(conn, request.args.getlist('customer_id'))
+    if not customers:
+        return jsonify({'error': 'No customers to export'}), 404
+    
+    def log_progress(done, total, customer, state):
+        print(f"Report export [{done}/{total}] {customer['name']}: {state}")
+    
+    filename = f"plant_care_reports_{datetime.now().strftime('%Y%m%d')}.zip"
+    return Response(stream_with_context(stream_reports_zip(conn, customers, log_progress)),
+                    mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@bp.route('/api/export/<kind>')
+def export_data_stream(kind):
+    """Stream every customer, note or image as CSV or NDJSON, optionally gzipped"""
+    if kind not in DATA_EXPORTS:
+        return jsonify({'error': 'Unknown export. Must be customers, notes or images'}), 404
+    
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'ndjson'):
+        return jsonify({'error': 'Invalid format. Must be csv or ndjson'}), 400
+    
+    since = request.args.get('since')
+    if since:
+        try:
+            datetime.fromisoformat(since)
+        except ValueError:
+            return jsonify({'error': 'Invalid since timestamp'}), 400
+    
+    compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+    if compress:
+        mimetype = 'application/gzip'
+    else:
+        mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    
+    filename = export_data_filename(kind, export_format, compress)
+    return Response(stream_with_context(stream_data_export(get_db(), kind, export_format, since, compress)),
+                    mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@bp.route('/api/import', methods=['POST'])
+def import_csv():
+    """Bulk import customers, notes and images from uploaded CSV files.
+
+    Takes multipart fields customers, notes and images, any of which may be
+    left out, and imports them in that order. Set copy_images to resize the
+    images into the blob store instead of referring to them in place.
+    """
+    files = {kind: request.files.get(kind) for kind in ('customers', 'notes', 'images')}
+    if not any(files.values()):
+        return jsonify({'error': 'No CSV files provided'}), 400
+    
+    copy_images = request.form.get('copy_images', '').lower() in ('1', 'true', 'yes')
+    importer = BulkImporter(get_db(), IMPORT_IMAGE_ROOT, copy_images)
+    for kind, load in (('customers', importer.import_customers),
+                       ('notes', importer.import_notes),
+                       ('images', importer.import_images)):
+        if files[kind]:
+            # Parsed as it is read from the spooled upload
+            load(io.TextIOWrapper(files[kind].stream, encoding='utf-8-sig', newline=''))
+    
+    return jsonify(importer.summary())
+
+@bp.route('/api/sync')
+def sync():
+    """Customers, notes and images created, updated or deleted since a checkpoint"""
+    checkpoint = request.args.get('checkpoint') or None
+    if checkpoint:
+        try:
+            checkpoint = decode_cursor(checkpoint, 2)
+        except ValueError:
+            return jsonify({'error': 'Invalid checkpoint'}), 400
+    
+    limit = request.args.get('limit', SYNC_PAGE_LIMIT, type=int)
+    if limit < 1 or limit > SYNC_PAGE_LIMIT:
+        return jsonify({'error': f'Limit must be between 1 and {SYNC_PAGE_LIMIT}'}), 400
+    
+    return jsonify(get_changes(get_db(), checkpoint, limit))
+
+@bp.route('/api/events')
+def events():
+    """Server-sent event stream of customer, note and image changes"""
+    response = Response(stream_with_context(stream_change_events(request.headers.get('Last-Event-ID'))),
+                        mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@bp.route('/metrics')
+def metrics():
+    """Request, SQL, image and report timings of this worker for Prometheus"""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/api/db/stats')
+def db_stats():
+    """Connection pool statistics for the worker that serves the request"""
+    return jsonify(get_pool_stats())
+
+@bp.app_errorhandler(404)
 def not_found(error):
     return jsonify({'error': 'Endpoint not found'}), 404
 
-@app.errorhandler(500)
+@bp.app_errorhandler(500)
 def internal_error(error):
     return jsonify({'error': 'Internal server error'}), 500
 
+@bp.app_errorhandler(DatabaseBusy)
+def database_busy(error):
+    response = jsonify({'error': 'Database is busy, please retry'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+def preload_subsystems():
+    """Load the imaging and reporting modules now instead of on first use"""
+    Image.init()
+    get_report_styles()
+
+def create_app(config=None):
+    """Create the Flask application.
+
+    The storage settings (DATABASE, UPLOAD_FOLDER, REPORT_CACHE_FOLDER) are
+    kept in the application's config, defaulting to the module's, so several
+    applications in one process can use their own database and files. Other
+    keys of config that name a module setting, such as WRITE_QUEUE, override
+    it for the whole process; the rest go to the Flask config. The database
+    is not initialized here; run --migrate before starting workers, or
+    init_db() within the application's context.
+    """
+    config = dict(config or {})
+    for key in [key for key in config
+                if key.isupper() and key in globals() and key not in STORAGE_SETTINGS]:
+        globals()[key] = config.pop(key)
+    
+    flask_app = Flask(__name__)
+    flask_app.config['USE_X_SENDFILE'] = USE_X_SENDFILE
+    flask_app.config.update({name: globals()[name] for name in STORAGE_SETTINGS})
+    flask_app.config.update(config)
+    flask_app.json = TimedJSONProvider(flask_app)
+    flask_app.register_blueprint(bp)
+    
+    os.makedirs(flask_app.config['UPLOAD_FOLDER'], exist_ok=True)
+    if PRELOAD_SUBSYSTEMS:
+        # Under gunicorn --preload this runs before the workers are forked
+        preload_subsystems()
+    return flask_app
+
+def __getattr__(name):
+    # `app:app` (gunicorn, flask run) gets an application created on first use
+    if name == 'app':
+        globals()['app'] = create_app()
+        return globals()['app']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 def parse_arguments():
     """Parse command line arguments"""
     parser = argparse.ArgumentParser(description='Plant Care Notes Flask Application')
@@ -867,18 +3861,69 @@ def parse_arguments():
                        help='Host to bind the Flask application to (default: 0.0.0.0)')
     parser.add_argument('--debug', action='store_true',
                        help='Run Flask in debug mode')
+    parser.add_argument('--migrate', action='store_true',
+                       help='Apply pending database migrations and exit')
+    parser.add_argument('--backfill-derivatives', action='store_true',
+                       help='Generate missing thumbnails and previews for existing images and exit')
+    parser.add_argument('--rebuild-search-index', action='store_true',
+                       help='Rebuild the full-text search index of notes and exit')
+    parser.add_argument('--export-reports', metavar='ZIP_PATH',
+                       help='Write the PDF reports of all customers to a ZIP archive and exit')
+    parser.add_argument('--customer', action='append', dest='customers', metavar='CUSTOMER_ID',
+                       help='Limit --export-reports to this customer (can be repeated)')
+    parser.add_argument('--export-data', metavar='DIRECTORY',
+                       help='Export customers, notes and images to files in DIRECTORY and exit')
+    parser.add_argument('--format', choices=['csv', 'ndjson'], default='csv',
+                       help='File format of --export-data (default: csv)')
+    parser.add_argument('--since', metavar='TIMESTAMP',
+                       help='Limit --export-data to rows created or updated at or after TIMESTAMP')
+    parser.add_argument('--gzip', action='store_true',
+                       help='Compress the files written by --export-data')
+    parser.add_argument('--import-csv', metavar='DIRECTORY',
+                       help='Import customers.csv, plant_notes.csv and note_images.csv from DIRECTORY and exit')
+    parser.add_argument('--image-root', default='.',
+                       help='Directory the file_path of imported images is relative to (default: .)')
+    parser.add_argument('--copy-images', action='store_true',
+                       help='Resize imported images into the upload folder instead of referring to them in place')
     return parser.parse_args()
 
 if __name__ == '__main__':
     # Parse command line arguments
     args = parse_arguments()
     
-    # Initialize database on startup
+    # Initialize database and upload folder on startup
     init_db()
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    
+    if args.migrate:
+        conn = get_db_connection()
+        print(f"Database schema is at version {get_schema_version(conn)}")
+        conn.close()
+        raise SystemExit(0)
+    
+    if args.backfill_derivatives:
+        backfill_image_derivatives()
+        raise SystemExit(0)
+    
+    if args.rebuild_search_index:
+        rebuild_search_index()
+        raise SystemExit(0)
+    
+    if args.export_reports:
+        export_reports(args.export_reports, args.customers)
+        raise SystemExit(0)
+    
+    if args.export_data:
+        export_data(args.export_data, args.format, args.since, args.gzip)
+        raise SystemExit(0)
+    
+    if args.import_csv:
+        import_csv_directory(args.import_csv, args.image_root, args.copy_images)
+        raise SystemExit(0)
     
     print(f"Starting Flask application on http://{args.host}:{args.port}")
     if args.debug:
         print("Debug mode enabled")
     
     # Run the application with parsed arguments
-    app.run(debug=args.debug, host=args.host, port=args.port)
\ No newline at end of file
+    create_app().run(debug=args.debug, host=args.host, port=args.port)
\ No newline at end of file
@@ -0,0 +1,111 @@
+"""Import-time benchmark: what `import app` costs a fresh interpreter.
+
+Every gunicorn worker, pool worker and command line invocation starts by
+importing app, so the imaging and reporting stacks are loaded on first use
+instead. This runs `python -X importtime -c "import app"` several times and
+reports the median import time, the heaviest modules app imports directly,
+and what create_app() and loading the lazy subsystems add on top.
+
+Exits with status 1 when the import exceeds the budget or loads a module that
+should be lazy, so it can be checked alongside the tests.
+
+Usage:
+    python benchmarks/bench_import.py [--runs 5] [--budget-ms 350] [--json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_BUDGET_MS = 350
+# Modules `import app` must leave for first use
+LAZY_MODULES = ['PIL.Image', 'reportlab.platypus', 'reportlab.lib.styles']
+TOP_MODULES = 10
+
+
+def run_python(code, *options):
+    result = subprocess.run([sys.executable, *options, '-c', code], cwd=REPO_ROOT,
+                            capture_output=True, text=True, check=True)
+    return result.stdout, result.stderr
+
+
+def measure_import():
+    """Cumulative microseconds by module of one `import app`, and the modules app imports directly"""
+    _, stderr = run_python('import app', '-X', 'importtime')
+    cumulative, children, direct = {}, [], []
+    # Modules are listed after everything they import, indented by depth
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        _, total, name = line[len('import time:'):].split('|')
+        module = name.strip()
+        cumulative[module] = int(total)
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children.append(module)
+        elif depth == 0:
+            if module == 'app':
+                direct = children
+            children = []
+    return cumulative, direct
+
+
+def measure_seconds(statement):
+    """Seconds statement takes after `import app`, in a fresh interpreter"""
+    stdout, _ = run_python(f'import time, app\nstarted = time.perf_counter()\n{statement}\n'
+                           f'print(time.perf_counter() - started)')
+    return float(stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the import time of app.py')
+    parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters to measure (default: 5)')
+    parser.add_argument('--budget-ms', type=float, default=IMPORT_BUDGET_MS,
+                        help=f'Fail when the median import takes longer (default: {IMPORT_BUDGET_MS})')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    runs = [measure_import() for _ in range(args.runs)]
+    import_ms = [cumulative['app'] / 1000 for cumulative, _ in runs]
+    cumulative, direct = runs[-1]
+    direct = sorted(direct, key=lambda module: -cumulative[module])[:TOP_MODULES]
+    eager = [module for module in LAZY_MODULES if any(module in imported for imported, _ in runs)]
+
+    results = {
+        'import_ms': round(statistics.median(import_ms), 1),
+        'import_min_ms': round(min(import_ms), 1),
+        'budget_ms': args.budget_ms,
+        'create_app_ms': round(statistics.median(
+            measure_seconds('app.create_app()') for _ in range(args.runs)) * 1000, 1),
+        'preload_subsystems_ms': round(statistics.median(
+            measure_seconds('app.preload_subsystems()') for _ in range(args.runs)) * 1000, 1),
+        'heaviest_imports_ms': {module: round(cumulative[module] / 1000, 1) for module in direct},
+        'eager_lazy_modules': eager,
+    }
+    failures = []
+    if results['import_ms'] > args.budget_ms:
+        failures.append(f"import app took {results['import_ms']}ms, over the {args.budget_ms}ms budget")
+    if eager:
+        failures.append(f"import app loaded {', '.join(eager)}, which should load on first use")
+
+    if args.json:
+        print(json.dumps(dict(results, ok=not failures), indent=2))
+    else:
+        print(f"import app:           {results['import_ms']}ms median, {results['import_min_ms']}ms best "
+              f"(budget {args.budget_ms}ms)")
+        print(f"create_app():         {results['create_app_ms']}ms")
+        print(f"preload_subsystems(): {results['preload_subsystems_ms']}ms, paid on first use otherwise")
+        print('heaviest direct imports:')
+        for module, milliseconds in results['heaviest_imports_ms'].items():
+            print(f"  {module:<28}{milliseconds:>8}ms")
+        for failure in failures:
+            print(f"FAIL: {failure}")
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""Micro-benchmark: single-pass ingest_image() vs the old save/resize/reopen path.
+
+The old path wrote the raw upload to disk, reopened and fully decoded it in
+resize_image(), overwrote it, then reopened it again for the renditions. It is
+reproduced here so the baseline stays fixed as app.py evolves.
+
+Usage:
+    python benchmarks/bench_ingest.py [--count 20] [--json]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+# (label, size, format) of the synthetic uploads, roughly what field staff send
+SAMPLES = [
+    ('phone photo', (4032, 3024), 'JPEG'),
+    ('downscaled photo', (1600, 1200), 'JPEG'),
+    ('small photo', (1024, 768), 'JPEG'),
+    ('screenshot', (1280, 800), 'PNG'),
+]
+
+
+def make_sample(size, image_format):
+    """Encode a noisy gradient image, which compresses like a real photo"""
+    width, height = size
+    gradient = Image.linear_gradient('L').resize(size)
+    noise = Image.effect_noise(size, 40)
+    img = Image.merge('RGB', (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    buffer = BytesIO()
+    img.save(buffer, image_format, quality=95)
+    return buffer.getvalue()
+
+
+def legacy_resize_image(image_path, max_width=1200, max_height=1200, quality=85):
+    """resize_image() as it was before single-pass ingestion"""
+    with Image.open(image_path) as img:
+        img = app.flatten_image(img)
+        width, height = img.size
+        if width > max_width or height > max_height:
+            ratio = min(max_width/width, max_height/height)
+            img = img.resize((int(width * ratio), int(height * ratio)), Image.Resampling.LANCZOS)
+        img.save(image_path, optimize=True, quality=quality)
+
+
+def legacy_derivatives(image_path):
+    """Renditions rendered by reopening and fully decoding the stored file"""
+    directory, filename = os.path.split(image_path)
+    with Image.open(image_path) as img:
+        rendition = app.flatten_image(img).convert('RGB')
+        for kind, size in sorted(app.IMAGE_DERIVATIVES.items(), key=lambda item: -item[1]):
+            rendition.thumbnail((size, size), Image.Resampling.LANCZOS)
+            rendition.save(os.path.join(directory, app.derivative_filename(filename, kind)),
+                           'JPEG', optimize=True, quality=app.DERIVATIVE_QUALITY)
+
+
+def run_legacy(data, file_path):
+    with open(file_path, 'wb') as out:
+        out.write(data)
+    legacy_resize_image(file_path)
+    legacy_derivatives(file_path)
+
+
+def run_ingest(data, file_path):
+    app.ingest_image(BytesIO(data), file_path)
+
+
+def measure(pipeline, data, extension, count, directory):
+    start = time.perf_counter()
+    for i in range(count):
+        pipeline(data, os.path.join(directory, f"{pipeline.__name__}-{i}.{extension}"))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark image ingestion pipelines')
+    parser.add_argument('--count', type=int, default=20, help='Images per sample (default: 20)')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='bench-ingest-')
+    results = []
+    try:
+        for label, size, image_format in SAMPLES:
+            data = make_sample(size, image_format)
+            extension = 'jpg' if image_format == 'JPEG' else image_format.lower()
+            # Warm up both paths so imports and codec setup are not measured
+            run_legacy(data, os.path.join(directory, f'warmup.{extension}'))
+            run_ingest(data, os.path.join(directory, f'warmup.{extension}'))
+
+            legacy = measure(run_legacy, data, extension, args.count, directory)
+            ingest = measure(run_ingest, data, extension, args.count, directory)
+            results.append({
+                'sample': label,
+                'size': f'{size[0]}x{size[1]}',
+                'upload_bytes': len(data),
+                'legacy_images_per_sec': round(args.count / legacy, 2),
+                'ingest_images_per_sec': round(args.count / ingest, 2),
+                'speedup': round(legacy / ingest, 2),
+            })
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'sample':<18}{'size':>11}{'upload':>10}{'legacy/s':>10}{'ingest/s':>10}{'speedup':>9}")
+    for result in results:
+        print(f"{result['sample']:<18}{result['size']:>11}{result['upload_bytes'] // 1024:>8}KB"
+              f"{result['legacy_images_per_sec']:>10}{result['ingest_images_per_sec']:>10}"
+              f"{result['speedup']:>8}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,408 @@
+"""Load benchmark: drive the app through realistic request mixes.
+
+Runs against a dataset made by seed_dataset.py, either in-process through
+Flask's test client, which isolates the application's own cost, or over HTTP
+against gunicorn on localhost, which adds the server and network stack. Each
+scenario is timed per operation; an operation is what one user action costs,
+so loading the dashboard is both of its listing requests.
+
+Scenarios:
+    dashboard    customer list and the first page of notes
+    filtered     a page of one customer's notes with a given status
+    search       a full-text search for a symptom
+    create_note  a note with one or two freshly taken photos
+    images       a thumbnail, preview or full image
+    report       a customer's PDF report, below the background job threshold
+    mixed        all of the above, weighted as on a busy day
+
+Notes created by the create_note and mixed scenarios are kept, and reports
+are cached once rendered, so reseed before runs that are compared closely.
+
+Usage:
+    python benchmarks/bench_load.py [--data benchmarks/data] [--mode client|gunicorn|both]
+        [--scenario mixed] [--operations 200] [--concurrency 4]
+        [--json results.json] [--compare baseline.json]
+"""
+import argparse
+import http.client
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+from bench_ingest import make_sample  # noqa: E402
+from seed_dataset import DEFAULT_OUTPUT, PLANTS, SYMPTOMS, TREATMENTS, use_dataset  # noqa: E402
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_SIZE = 400  # rows of each kind sampled from the dataset to pick requests from
+NOTES_PAGE_SIZE = 50  # as the dashboard requests
+SERVER_START_TIMEOUT = 60  # seconds
+
+# Share of each scenario in the mixed workload, mostly reads as in the field
+MIX_WEIGHTS = {'dashboard': 20, 'filtered': 25, 'search': 10, 'images': 35, 'create_note': 8, 'report': 2}
+
+
+class Dataset:
+    """Ids and URLs sampled from a seeded database to build requests from"""
+
+    def __init__(self, database, rng):
+        conn = sqlite3.connect(database)
+        conn.row_factory = sqlite3.Row
+        try:
+            self.counts = {table: conn.execute(f'SELECT count(*) FROM {table}').fetchone()[0]
+                           for table in ('customers', 'plant_notes', 'note_images')}
+            if not self.counts['plant_notes']:
+                raise SystemExit(f'{database} has no notes; run seed_dataset.py first')
+            self.customers = [row['id'] for row in self.sample(conn, rng, 'customers')]
+            # Only reports small enough to be rendered in the request
+            self.report_customers = [row['scope'] for row in conn.execute('''
+                SELECT scope FROM status_summary WHERE scope != 'all'
+                GROUP BY scope HAVING sum(note_count) <= ? LIMIT ?
+            ''', (app.REPORT_JOB_THRESHOLD, SAMPLE_SIZE))]
+            self.images = []
+            for row in self.sample(conn, rng, 'note_images'):
+                image = conn.execute('''
+                    SELECT i.filename, i.thumbnail_filename, i.preview_filename, n.id, n.customer_id
+                    FROM note_images i JOIN plant_notes n ON n.id = i.note_id WHERE i.id = ?
+                ''', (row['id'],)).fetchone()
+                for filename in (image['filename'], image['thumbnail_filename'], image['preview_filename']):
+                    if filename:
+                        self.images.append(f"/uploads/{image['customer_id']}/{image['id']}/{filename}")
+        finally:
+            conn.close()
+
+    @staticmethod
+    def sample(conn, rng, table):
+        """Up to SAMPLE_SIZE random rows of a table, picked by rowid"""
+        highest = conn.execute(f'SELECT max(rowid) FROM {table}').fetchone()[0] or 0
+        rowids = {rng.randrange(1, highest + 1) for _ in range(min(SAMPLE_SIZE, highest))}
+        return conn.execute(f'SELECT * FROM {table} WHERE rowid IN (SELECT value FROM json_each(?))',
+                            (json.dumps(sorted(rowids)),)).fetchall()
+
+
+def make_photos(count=8):
+    """Small phone-sized JPEGs to upload, encoded once up front"""
+    return [make_sample(size, 'JPEG') for size in [(1024, 768), (1600, 1200)] * (count // 2)]
+
+
+# Each scenario returns the requests of one operation as
+# (method, path, form fields, [(field, filename, bytes)]) tuples
+
+def dashboard(dataset, rng, photos):
+    return [('GET', '/api/customers', None, None),
+            ('GET', f'/api/notes?limit={NOTES_PAGE_SIZE}', None, None)]
+
+
+def filtered(dataset, rng, photos):
+    status = rng.choice(['healthy', 'unhealthy', 'treated'])
+    return [('GET', f'/api/notes?customer_id={rng.choice(dataset.customers)}&status={status}'
+                    f'&limit={NOTES_PAGE_SIZE}', None, None)]
+
+
+def search(dataset, rng, photos):
+    term = rng.choice(SYMPTOMS).split()[0]
+    return [('GET', f'/api/notes/search?q={term}&limit={NOTES_PAGE_SIZE}', None, None)]
+
+
+def create_note(dataset, rng, photos):
+    plant = rng.choice(PLANTS)
+    fields = {
+        'customer_id': rng.choice(dataset.customers),
+        'plant_name': plant,
+        'condition': f'{plant} showing {rng.choice(SYMPTOMS)}',
+        'recommended_treatment': rng.choice(TREATMENTS),
+        'status': rng.choice(['healthy', 'unhealthy', 'treated'])
+    }
+    # Trailing bytes keep each upload unique, so it is processed rather than deduplicated
+    files = [('images', f'photo-{i}.jpg', rng.choice(photos) + rng.randbytes(16))
+             for i in range(rng.randint(1, 2))]
+    return [('POST', '/api/notes', fields, files)]
+
+
+def images(dataset, rng, photos):
+    return [('GET', rng.choice(dataset.images), None, None)]
+
+
+def report(dataset, rng, photos):
+    return [('GET', f'/api/customers/{rng.choice(dataset.report_customers)}/report', None, None)]
+
+
+SCENARIOS = {
+    'dashboard': dashboard,
+    'filtered': filtered,
+    'search': search,
+    'create_note': create_note,
+    'images': images,
+    'report': report,
+}
+
+
+def mixed(dataset, rng, photos):
+    name = rng.choices(list(MIX_WEIGHTS), list(MIX_WEIGHTS.values()))[0]
+    return SCENARIOS[name](dataset, rng, photos)
+
+
+SCENARIOS['mixed'] = mixed
+
+
+class ClientRunner:
+    """Sends requests through the Flask test client, one client per thread"""
+    mode = 'client'
+
+    def __init__(self):
+        self.app = app.create_app()
+        self.local = threading.local()
+
+    def send(self, method, path, fields, files):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        data = None
+        if fields is not None:
+            data = dict(fields)
+            for field, filename, content in files or ():
+                data.setdefault(field, []).append((BytesIO(content), filename))
+        response = client.open(path, method=method, data=data)
+        response.get_data()
+        response.close()
+        return response.status_code
+
+
+class HttpRunner:
+    """Sends requests to a server over HTTP, with a connection per request"""
+    mode = 'gunicorn'
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+
+    def send(self, method, path, fields, files):
+        body, headers = None, {}
+        if fields is not None:
+            body, content_type = encode_multipart(fields, files or ())
+            headers['Content-Type'] = content_type
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=120)
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        finally:
+            connection.close()
+
+
+def encode_multipart(fields, files):
+    boundary = uuid.uuid4().hex
+    body = BytesIO()
+    for name, value in fields.items():
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'
+                   f'{value}\r\n'.encode())
+    for name, filename, content in files:
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; '
+                   f'filename="{filename}"\r\nContent-Type: image/jpeg\r\n\r\n'.encode())
+        body.write(content)
+        body.write(b'\r\n')
+    body.write(f'--{boundary}--\r\n'.encode())
+    return body.getvalue(), f'multipart/form-data; boundary={boundary}'
+
+
+def start_gunicorn(port, workers, threads):
+    """Serve the app from the dataset directory and wait until it answers"""
+    environment = dict(os.environ, DATABASE=app.DATABASE, UPLOAD_FOLDER=app.UPLOAD_FOLDER,
+                       REPORT_CACHE_FOLDER=app.REPORT_CACHE_FOLDER)
+    server = subprocess.Popen([
+        sys.executable, '-m', 'gunicorn', '--chdir', REPO_ROOT, '--bind', f'127.0.0.1:{port}',
+        '--workers', str(workers), '--threads', str(threads), '--log-level', 'warning', 'app:create_app()'
+    ], env=environment)
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f'gunicorn exited with status {server.returncode}')
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', '/api/stats')
+            connection.getresponse().read()
+            connection.close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise SystemExit(f'gunicorn did not start within {SERVER_START_TIMEOUT}s')
+
+
+def percentile(ordered, p):
+    """Nearest-rank percentile of an ascending list"""
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def run_scenario(runner, scenario, dataset, photos, operations, warmup, concurrency, seed):
+    """Time operations of a scenario spread over concurrency threads"""
+    counter = itertools.count()
+    lock = threading.Lock()
+    latencies = []
+    errors = []
+
+    def worker(index):
+        rng = random.Random(f'{seed}-{scenario}-{index}')
+        timings, failures = [], 0
+        while True:
+            with lock:
+                number = next(counter)
+            if number >= warmup + operations:
+                break
+            requests = SCENARIOS[scenario](dataset, rng, photos)
+            start = time.perf_counter()
+            statuses = [runner.send(*request) for request in requests]
+            elapsed = time.perf_counter() - start
+            if number >= warmup:
+                timings.append(elapsed)
+                failures += any(status >= 400 for status in statuses)
+        with lock:
+            latencies.extend(timings)
+            errors.append(failures)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'mode': runner.mode,
+        'scenario': scenario,
+        'operations': len(latencies),
+        'errors': sum(errors),
+        'seconds': round(elapsed, 3),
+        # Warmup operations run first, so the wall time slightly overstates the measured ones
+        'ops_per_sec': round(len(latencies) / elapsed, 2),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'max_ms': round(latencies[-1] * 1000, 2),
+    }
+
+
+def git_revision():
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                                  capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                               cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip()
+        return f'{revision}-dirty' if dirty else revision
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_comparison(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {(result['mode'], result['scenario']): result for result in json.load(f)['results']}
+    print(f"\nvs {baseline_path}")
+    print(f"{'mode':<10}{'scenario':<13}{'ops/s':>10}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for result in results:
+        previous = baseline.get((result['mode'], result['scenario']))
+        if previous is None:
+            continue
+        changes = [f"{(result[key] - previous[key]) / previous[key] * 100:+.1f}%" if previous[key] else 'n/a'
+                   for key in ('ops_per_sec', 'p50_ms', 'p95_ms', 'p99_ms')]
+        print(f"{result['mode']:<10}{result['scenario']:<13}" + ''.join(f'{c:>10}' for c in changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the app under realistic request mixes')
+    parser.add_argument('--data', default=DEFAULT_OUTPUT,
+                        help='Dataset directory made by seed_dataset.py (default: benchmarks/data)')
+    parser.add_argument('--mode', choices=['client', 'gunicorn', 'both'], default='client',
+                        help='Drive the test client, gunicorn on localhost, or both (default: client)')
+    parser.add_argument('--scenario', action='append', choices=list(SCENARIOS),
+                        help='Scenario to run, repeatable (default: all)')
+    parser.add_argument('--operations', type=int, default=200, help='Timed operations per scenario (default: 200)')
+    parser.add_argument('--warmup', type=int, default=10, help='Untimed operations per scenario (default: 10)')
+    parser.add_argument('--concurrency', type=int, default=4, help='Concurrent users (default: 4)')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn worker processes (default: 4)')
+    parser.add_argument('--threads', type=int, default=1, help='gunicorn threads per worker (default: 1)')
+    parser.add_argument('--port', type=int, default=8765, help='gunicorn port (default: 8765)')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed (default: 42)')
+    parser.add_argument('--json', metavar='PATH', help='Write results as JSON to PATH')
+    parser.add_argument('--compare', metavar='PATH', help='Compare with results from an earlier --json run')
+    args = parser.parse_args()
+
+    data = os.path.abspath(args.data)
+    output = os.path.abspath(args.json) if args.json else None
+    baseline = os.path.abspath(args.compare) if args.compare else None
+    if not os.path.exists(os.path.join(data, 'plant_notes.db')):
+        parser.error(f'no dataset in {data}; run seed_dataset.py first')
+    use_dataset(data)
+    app.init_db()
+
+    dataset = Dataset(app.DATABASE, random.Random(args.seed))
+    photos = make_photos()
+    scenarios = args.scenario or list(SCENARIOS)
+    if not dataset.report_customers and 'report' in scenarios:
+        scenarios.remove('report')
+        MIX_WEIGHTS.pop('report')
+    if not dataset.images and 'images' in scenarios:
+        scenarios.remove('images')
+        MIX_WEIGHTS.pop('images')
+
+    results = []
+    modes = ['client', 'gunicorn'] if args.mode == 'both' else [args.mode]
+    for mode in modes:
+        server = None
+        if mode == 'gunicorn':
+            server = start_gunicorn(args.port, args.workers, args.threads)
+            runner = HttpRunner('127.0.0.1', args.port)
+        else:
+            runner = ClientRunner()
+        try:
+            for scenario in scenarios:
+                result = run_scenario(runner, scenario, dataset, photos, args.operations,
+                                      args.warmup, args.concurrency, args.seed)
+                results.append(result)
+                print(f"{mode:<10}{scenario:<13}{result['ops_per_sec']:>9} ops/s  p50 {result['p50_ms']}ms"
+                      f"  p95 {result['p95_ms']}ms  p99 {result['p99_ms']}ms  errors {result['errors']}",
+                      flush=True)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump({
+                'meta': {
+                    'revision': git_revision(),
+                    'date': datetime.now().isoformat(),
+                    'python': platform.python_version(),
+                    'cpus': os.cpu_count(),
+                    'dataset': dataset.counts,
+                    'operations': args.operations,
+                    'concurrency': args.concurrency,
+                    'gunicorn': {'workers': args.workers, 'threads': args.threads},
+                    'seed': args.seed,
+                },
+                'results': results
+            }, f, indent=2)
+
+    if baseline:
+        print_comparison(results, baseline)
+
+
+if __name__ == '__main__':
+    main()
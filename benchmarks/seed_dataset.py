@@ -0,0 +1,237 @@
+"""Seed a synthetic dataset at production scale for the load benchmarks.
+
+Customers, notes and images are written straight into SQLite with the app's
+schema, triggers included, so the search index, status summaries, revisions
+and change log come out exactly as if the rows had been entered through the
+API. Images are real JPEGs of varied sizes, processed into the blob store by
+the app's own ingestion; --distinct-images of them are generated and shared
+between the note_images rows, the way identical uploads share a blob.
+
+The dataset is written to its own directory laid out like a deployment
+(plant_notes.db and uploads/ side by side), which bench_load.py runs against.
+Images are recorded under absolute paths, so keep the directory where it is.
+
+Usage:
+    python benchmarks/seed_dataset.py [--output benchmarks/data] [--customers 10000]
+        [--notes 1000000] [--images 100000] [--distinct-images 1000] [--seed 42]
+"""
+import argparse
+import hashlib
+import os
+import random
+import shutil
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from io import BytesIO
+
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+from bench_ingest import make_sample  # noqa: E402
+
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+BATCH_SIZE = 20000
+
+# Upload sizes, from phone photos down to images already downscaled on device
+IMAGE_SIZES = [(4032, 3024), (3024, 4032), (2048, 1536), (1600, 1200), (1024, 768), (640, 480)]
+
+FIRST_NAMES = ['Ada', 'Ben', 'Chloe', 'Dev', 'Elena', 'Farid', 'Grace', 'Hiro', 'Ines', 'Jonah',
+               'Keiko', 'Liam', 'Maya', 'Nikhil', 'Olga', 'Priya', 'Quinn', 'Rosa', 'Sam', 'Tomas']
+LAST_NAMES = ['Adler', 'Baker', 'Castillo', 'Dubois', 'Eriksen', 'Fischer', 'Gupta', 'Hughes',
+              'Ivanova', 'Jensen', 'Kowalski', 'Lopez', 'Moreau', 'Nakamura', 'Okafor', 'Patel']
+STREETS = ['Elm St', 'Garden Ave', 'Orchard Rd', 'Meadow Ln', 'Willow Way', 'Greenhouse Blvd']
+PLANTS = ['Monstera', 'Fiddle Leaf Fig', 'Snake Plant', 'Pothos', 'Peace Lily', 'Rubber Plant',
+          'Boston Fern', 'Calathea', 'ZZ Plant', 'Orchid', 'Aloe Vera', 'Bird of Paradise',
+          'Rose Bush', 'Tomato', 'Basil', 'Lavender', 'Hydrangea', 'Olive Tree', 'Bonsai', 'Cactus']
+SYMPTOMS = ['yellowing leaves', 'brown leaf tips', 'drooping stems', 'root rot', 'spider mites',
+            'powdery mildew', 'leaf spot', 'aphids on new growth', 'scale insects', 'sunburn',
+            'overwatering', 'underwatering', 'nutrient deficiency', 'leggy growth', 'wilting']
+TREATMENTS = ['reduce watering to once a week', 'move to bright indirect light', 'apply neem oil',
+              'repot with fresh well-draining soil', 'prune affected leaves', 'apply balanced fertilizer',
+              'increase humidity', 'treat with insecticidal soap', 'improve air circulation',
+              'water deeply when the top inch is dry', 'no action needed, monitor monthly']
+# Most visits find plants doing fine
+STATUS_WEIGHTS = {'healthy': 50, 'treated': 30, 'unhealthy': 20}
+
+
+def use_dataset(directory):
+    """Point the app at a dataset directory, by absolute paths so stored images are served from it"""
+    app.DATABASE = os.path.join(directory, 'plant_notes.db')
+    app.UPLOAD_FOLDER = os.path.join(directory, 'uploads')
+    app.REPORT_CACHE_FOLDER = os.path.join(directory, 'report_cache')
+
+
+def uuid_from(rng):
+    """Random UUID drawn from rng, so a seed reproduces the same ids"""
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def random_date(rng, start, span):
+    return start + timedelta(seconds=rng.randrange(span))
+
+
+def customer_rows(rng, count, start, span):
+    for i in range(count):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        yield (uuid_from(rng), f'{first} {last} {i:06d}',
+               f'{first.lower()}.{last.lower()}{i}@example.com',
+               f'555-{rng.randrange(10000):04d}',
+               f'{rng.randrange(1, 9999)} {rng.choice(STREETS)}',
+               random_date(rng, start, span).isoformat())
+
+
+def note_rows(rng, count, customers, start, span):
+    """Notes spread over customers with a long tail, so a few have thousands"""
+    weights = [1 / (rank + 1) ** 0.8 for rank in range(len(customers))]
+    statuses, status_weights = zip(*STATUS_WEIGHTS.items())
+    end = start + timedelta(seconds=span)
+    produced = 0
+    while produced < count:
+        batch = min(BATCH_SIZE, count - produced)
+        owners = rng.choices(customers, weights, k=batch)
+        for customer_id, customer_name in owners:
+            created = random_date(rng, start, span)
+            # About a third of notes were edited after a follow-up visit
+            updated = created
+            if rng.random() < 0.3:
+                updated = min(created + timedelta(days=rng.randrange(60)), end)
+            plant = rng.choice(PLANTS)
+            yield (uuid_from(rng), customer_id, customer_name, plant,
+                   f'{plant} showing {rng.choice(SYMPTOMS)} and {rng.choice(SYMPTOMS)}',
+                   f'{rng.choice(TREATMENTS).capitalize()}; {rng.choice(TREATMENTS)}',
+                   rng.choices(statuses, status_weights)[0], created.isoformat(), updated.isoformat())
+        produced += batch
+
+
+def create_blob(size, seed):
+    """Generate a JPEG and process it into the blob store, as an upload would be"""
+    # Forked workers share the noise generator's state, so vary each image explicitly
+    img = Image.open(BytesIO(make_sample(size, 'JPEG')))
+    ImageDraw.Draw(img).text((10, 10), f'sample {seed}', fill=(255, 255, 255))
+    buffer = BytesIO()
+    img.save(buffer, 'JPEG', quality=95)
+    data = buffer.getvalue()
+    return app.store_image_blob(BytesIO(data), 'jpg', hashlib.sha256(data).hexdigest())
+
+
+def write_batches(conn, query, rows, label, total):
+    start = time.perf_counter()
+    written = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            conn.executemany(query, batch)
+            conn.commit()
+            written += len(batch)
+            batch = []
+            elapsed = time.perf_counter() - start
+            print(f"  {label}: {written}/{total} ({written / elapsed:.0f} rows/s)", flush=True)
+    if batch:
+        conn.executemany(query, batch)
+        conn.commit()
+        written += len(batch)
+    elapsed = time.perf_counter() - start
+    print(f"{label}: {written} rows in {elapsed:.1f}s", flush=True)
+    return elapsed
+
+
+def seed_images(conn, rng, count, distinct, workers, start, span):
+    """Generate distinct blobs and attach count images to random notes"""
+    began = time.perf_counter()
+    sizes = [rng.choice(IMAGE_SIZES) for _ in range(distinct)]
+    with ProcessPoolExecutor(workers) as pool:
+        blobs = list(pool.map(create_blob, sizes, range(distinct)))
+    for blob in blobs:
+        app.insert_image_blob(conn, blob)
+    conn.commit()
+    print(f"image blobs: {len(blobs)} in {time.perf_counter() - began:.1f}s", flush=True)
+
+    note_count = conn.execute('SELECT max(rowid) FROM plant_notes').fetchone()[0]
+
+    def rows():
+        for _ in range(count):
+            blob = rng.choice(blobs)
+            fields = app.blob_image_fields(blob)
+            yield (uuid_from(rng), fields['filename'], f'IMG_{rng.randrange(10000):04d}.jpg',
+                   fields['file_path'], fields['file_size'], random_date(rng, start, span).isoformat(),
+                   fields['thumbnail_filename'], fields['preview_filename'], fields['blob_hash'],
+                   rng.randrange(1, note_count + 1))
+
+    # Notes are picked by rowid, which runs 1..n in a freshly seeded table
+    return write_batches(conn, '''
+        INSERT INTO note_images (id, note_id, filename, original_filename, file_path, file_size,
+                                 date_uploaded, thumbnail_filename, preview_filename,
+                                 processing_state, blob_hash)
+        SELECT ?, id, ?, ?, ?, ?, ?, ?, ?, 'ready', ? FROM plant_notes WHERE rowid = ?
+    ''', rows(), 'images', count)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed a synthetic dataset for load benchmarks')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT,
+                        help='Directory for plant_notes.db and uploads/ (default: benchmarks/data)')
+    parser.add_argument('--customers', type=int, default=10000, help='Customers (default: 10000)')
+    parser.add_argument('--notes', type=int, default=1000000, help='Plant notes (default: 1000000)')
+    parser.add_argument('--images', type=int, default=100000, help='Note images (default: 100000)')
+    parser.add_argument('--distinct-images', type=int, default=1000,
+                        help='Distinct JPEG files the images share (default: 1000)')
+    parser.add_argument('--days', type=int, default=3 * 365,
+                        help='Days of history the dates span (default: 1095)')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed (default: 42)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Processes generating images (default: CPU count)')
+    parser.add_argument('--force', action='store_true', help='Replace an existing dataset')
+    args = parser.parse_args()
+
+    if args.customers < 1 or (args.images and not args.notes):
+        parser.error('notes need at least one customer and images at least one note')
+
+    output = os.path.abspath(args.output)
+    if os.path.exists(os.path.join(output, 'plant_notes.db')):
+        if not args.force:
+            parser.error(f'{output} already holds a dataset; pass --force to replace it')
+        shutil.rmtree(output)
+    use_dataset(output)
+    os.makedirs(app.UPLOAD_FOLDER)
+
+    app.init_db()
+    conn = app.get_db_connection()
+    # A lost seed is simply rerun, so skip the fsyncs
+    conn.execute('PRAGMA synchronous = OFF')
+
+    rng = random.Random(args.seed)
+    span = args.days * 24 * 60 * 60
+    start = datetime.now() - timedelta(seconds=span)
+    began = time.perf_counter()
+
+    customers = list(customer_rows(rng, args.customers, start, span))
+    write_batches(conn, '''
+        INSERT INTO customers (id, name, email, phone, address, date_created)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', customers, 'customers', args.customers)
+
+    write_batches(conn, '''
+        INSERT INTO plant_notes (id, customer_id, customer_name, plant_name, condition,
+                                 recommended_treatment, status, date_created, date_updated)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', note_rows(rng, args.notes, [(row[0], row[1]) for row in customers], start, span),
+        'notes', args.notes)
+
+    if args.images:
+        seed_images(conn, rng, args.images, max(1, min(args.distinct_images, args.images)),
+                    args.workers, start, span)
+
+    conn.execute('ANALYZE')
+    conn.commit()
+    conn.close()
+    print(f"Seeded {output} in {time.perf_counter() - began:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,9 @@
 #!/bin/bash
 
-# gunicorn -w 4 -b 0.0.0.0:5000 app:app --log-level debug
-
-export FLASK_ENV=development && python app.py --host 0.0.0.0 --port 7000
-
+# Development server:
+# export FLASK_ENV=development && python app.py --host 0.0.0.0 --port 7000
 
+# Each open dashboard holds a worker thread for its event stream, so run
+# threaded workers rather than gunicorn's default sync ones
+python app.py --migrate
+gunicorn -k gthread -w 4 --threads 8 -b 0.0.0.0:7000 'app:create_app()' --log-level debug
@@ -0,0 +1,56 @@
+"""Fixtures shared by the tests: an application on a temporary database"""
+import os
+import sys
+import uuid
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+
+@pytest.fixture
+def flask_app(tmp_path):
+    flask_app = app.create_app({
+        'DATABASE': str(tmp_path / 'plant_notes.db'),
+        'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+        'REPORT_CACHE_FOLDER': str(tmp_path / 'report_cache'),
+        'TESTING': True,
+    })
+    with flask_app.app_context():
+        app.init_db()
+    return flask_app
+
+
+@pytest.fixture
+def client(flask_app):
+    return flask_app.test_client()
+
+
+@pytest.fixture
+def db(flask_app):
+    """A connection of its own to the application's database"""
+    with flask_app.app_context():
+        conn = app.get_db_connection()
+    yield conn
+    conn.close()
+
+
+def add_customer(client):
+    response = client.post('/api/customers', json={'name': f'Customer {uuid.uuid4()}'})
+    assert response.status_code == 201
+    return response.get_json()['id']
+
+
+def add_note(client, customer_id, **fields):
+    response = client.post('/api/notes', json={
+        'customer_id': customer_id,
+        'plant_name': 'Fern',
+        'condition': 'Dry soil',
+        'recommended_treatment': 'Water weekly',
+        'status': 'healthy',
+        **fields
+    })
+    assert response.status_code == 201
+    return response.get_json()
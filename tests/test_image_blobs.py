@@ -0,0 +1,98 @@
+"""Identical uploads share one blob in the store, which is reclaimed, files
+and all, when the last image referring to it is deleted."""
+import io
+import os
+
+from PIL import Image
+
+import app
+from conftest import add_customer, add_note
+
+
+def jpeg(color=(120, 160, 80)):
+    image = io.BytesIO()
+    Image.new('RGB', (320, 240), color).save(image, 'JPEG')
+    return image.getvalue()
+
+
+def upload(client, note_id, data, filename='leaf.jpg'):
+    response = client.post(f'/api/notes/{note_id}/images',
+                           data={'images': (io.BytesIO(data), filename)},
+                           content_type='multipart/form-data')
+    assert response.status_code == 201
+    return response.get_json()['images'][0]
+
+
+def delete_image(client, note_id, image_id):
+    response = client.delete(f'/api/notes/{note_id}/images', json={'image_id': image_id})
+    assert response.status_code == 200
+
+
+def blob_of(db, image_id):
+    return db.execute('''
+        SELECT image_blobs.* FROM image_blobs
+        JOIN note_images ON note_images.blob_hash = image_blobs.hash
+        WHERE note_images.id = ?
+    ''', (image_id,)).fetchone()
+
+
+def ref_count(db, blob_hash):
+    row = db.execute('SELECT ref_count FROM image_blobs WHERE hash = ?', (blob_hash,)).fetchone()
+    return row['ref_count'] if row else None
+
+
+def test_identical_uploads_share_one_blob(client, db):
+    note = add_note(client, add_customer(client))
+    data = jpeg()
+    first = upload(client, note['id'], data, 'first.jpg')
+    second = upload(client, note['id'], data, 'second.jpg')
+
+    blob = blob_of(db, first['id'])
+    assert blob is not None
+    assert blob_of(db, second['id'])['hash'] == blob['hash']
+    assert db.execute('SELECT COUNT(*) FROM image_blobs').fetchone()[0] == 1
+    assert blob['ref_count'] == 2
+    assert os.path.exists(blob['file_path'])
+
+
+def test_blob_is_removed_with_its_last_image(client, db):
+    note = add_note(client, add_customer(client))
+    data = jpeg()
+    first = upload(client, note['id'], data)
+    second = upload(client, note['id'], data)
+    blob = dict(blob_of(db, first['id']))
+
+    delete_image(client, note['id'], first['id'])
+    assert ref_count(db, blob['hash']) == 1
+    assert app.blob_files_exist(blob)
+    assert client.get(second['url']).status_code == 200
+
+    delete_image(client, note['id'], second['id'])
+    assert ref_count(db, blob['hash']) is None
+    assert not os.path.exists(blob['file_path'])
+
+
+def test_upload_stores_a_blob_reclaimed_after_lookup_again(client, db, monkeypatch):
+    customer_id = add_customer(client)
+    earlier = add_note(client, customer_id)
+    data = jpeg()
+    upload(client, earlier['id'], data)
+    find_image_blob = app.find_image_blob
+
+    def find_then_reclaim(conn, source_hash, extension):
+        # The only image using the blob is deleted between the upload's
+        # lookup and its write, which removes the blob's files
+        blob = find_image_blob(conn, source_hash, extension)
+        response = client.delete(f"/api/notes/{earlier['id']}")
+        assert response.status_code == 200
+        assert not app.blob_files_exist(blob)
+        return blob
+
+    monkeypatch.setattr(app, 'find_image_blob', find_then_reclaim)
+    note = add_note(client, customer_id)
+    image = upload(client, note['id'], data)
+
+    blob = dict(blob_of(db, image['id']))
+    assert blob['ref_count'] == 1
+    assert app.blob_files_exist(blob)
+    assert client.get(image['url']).status_code == 200
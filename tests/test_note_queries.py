@@ -0,0 +1,116 @@
+"""The note endpoints load notes and their images with a fixed number of
+queries, however many notes there are."""
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from flask import g
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+NOTES = 20
+IMAGES_PER_NOTE = 2
+
+
+@pytest.fixture
+def client(tmp_path):
+    flask_app = app.create_app({
+        'DATABASE': str(tmp_path / 'plant_notes.db'),
+        'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+        'REPORT_CACHE_FOLDER': str(tmp_path / 'report_cache'),
+        'TESTING': True,
+    })
+    with flask_app.app_context():
+        app.init_db()
+
+    # Statements each request ran on its database connection
+    query_counts = []
+
+    @flask_app.before_request
+    def trace_queries():
+        g.statements = []
+        app.get_db().set_trace_callback(g.statements.append)
+
+    @flask_app.after_request
+    def count_queries(response):
+        app.get_db().set_trace_callback(None)
+        query_counts.append(len(g.statements))
+        return response
+
+    test_client = flask_app.test_client()
+    test_client.query_counts = query_counts
+    return test_client
+
+
+def add_customer(client):
+    response = client.post('/api/customers', json={'name': f'Customer {uuid.uuid4()}'})
+    assert response.status_code == 201
+    return response.get_json()['id']
+
+
+def seed_notes(client, customer_id, count):
+    """Insert count notes with IMAGES_PER_NOTE images each and return their ids"""
+    started = datetime(2024, 1, 1)
+    notes = []
+    images = []
+    for i in range(count):
+        note_id = str(uuid.uuid4())
+        created = (started + timedelta(minutes=i)).isoformat()
+        notes.append((note_id, customer_id, 'Customer', f'Plant {i}', 'Dry soil',
+                      'Water weekly', 'healthy', created, created))
+        for j in range(IMAGES_PER_NOTE):
+            filename = f'{uuid.uuid4()}.jpg'
+            images.append((str(uuid.uuid4()), note_id, filename, f'photo{j}.jpg',
+                           os.path.join('uploads', filename), 1024, created))
+
+    with client.application.app_context():
+        conn = app.get_db_connection()
+        conn.executemany('''
+            INSERT INTO plant_notes (id, customer_id, customer_name, plant_name, condition,
+                                     recommended_treatment, status, date_created, date_updated)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', notes)
+        conn.executemany('''
+            INSERT INTO note_images (id, note_id, filename, original_filename, file_path,
+                                     file_size, date_uploaded)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', images)
+        conn.commit()
+        conn.close()
+    return [note[0] for note in notes]
+
+
+def query_count(client, url):
+    """Number of SQL statements a successful GET of url ran"""
+    client.query_counts.clear()
+    response = client.get(url)
+    assert response.status_code == 200
+    return client.query_counts[-1], response.get_json()
+
+
+@pytest.mark.parametrize('endpoint', [
+    '/api/notes',
+    '/api/customers/{customer_id}/notes',
+    '/api/notes/{note_id}',
+])
+def test_query_count_does_not_grow_with_notes(client, endpoint):
+    customer_id = add_customer(client)
+    note_id = seed_notes(client, customer_id, NOTES)[0]
+    url = endpoint.format(customer_id=customer_id, note_id=note_id)
+    queries, _ = query_count(client, url)
+
+    seed_notes(client, customer_id, 9 * NOTES)
+    queries_at_ten_times, body = query_count(client, url)
+
+    if isinstance(body, list):
+        notes = body
+    else:
+        notes = body['notes'] if 'notes' in body else [body]
+    if endpoint != '/api/notes/{note_id}':
+        assert len(notes) == 10 * NOTES
+    assert all(len(note['images']) == IMAGES_PER_NOTE for note in notes)
+    assert queries_at_ten_times == queries
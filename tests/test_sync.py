@@ -0,0 +1,43 @@
+"""A sync from a checkpoint returns only the changes made since, deletes
+included as tombstones."""
+from conftest import add_customer, add_note
+
+
+def sync(client, checkpoint=None):
+    response = client.get('/api/sync', query_string={'checkpoint': checkpoint} if checkpoint else {})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_sync_returns_changes_since_checkpoint(client):
+    customer_id = add_customer(client)
+    kept = add_note(client, customer_id, plant_name='Kept')
+    updated = add_note(client, customer_id, plant_name='Updated')
+    deleted = add_note(client, customer_id, plant_name='Deleted')
+
+    first = sync(client)
+    assert first['reset']
+    assert {note['id'] for note in first['notes']} == {kept['id'], updated['id'], deleted['id']}
+
+    created = add_note(client, customer_id, plant_name='Created')
+    response = client.put(f"/api/notes/{updated['id']}", json={'status': 'treated'})
+    assert response.status_code == 200
+    assert client.delete(f"/api/notes/{deleted['id']}").status_code == 200
+    # Created and deleted since the checkpoint: only the tombstone is sent
+    transient = add_note(client, customer_id, plant_name='Transient')
+    assert client.delete(f"/api/notes/{transient['id']}").status_code == 200
+
+    second = sync(client, first['checkpoint'])
+    assert not second['reset']
+    assert not second['has_more']
+    assert second['customers'] == []
+    assert second['deleted_customers'] == []
+    notes = {note['id']: note for note in second['notes']}
+    assert set(notes) == {created['id'], updated['id']}
+    assert notes[updated['id']]['status'] == 'treated'
+    assert sorted(second['deleted_notes']) == sorted([deleted['id'], transient['id']])
+
+    third = sync(client, second['checkpoint'])
+    assert third['notes'] == []
+    assert third['deleted_notes'] == []
+    assert third['checkpoint'] == second['checkpoint']
@@ -0,0 +1,117 @@
+"""Writes run as operations in BEGIN IMMEDIATE transactions: an operation
+that fails is rolled back alone, and a database that stays locked turns
+into 503 responses rather than errors."""
+import sqlite3
+import threading
+import time
+import uuid
+
+import pytest
+
+import app
+
+
+def insert_customer(name):
+    def write(conn):
+        conn.execute('INSERT INTO customers (id, name, date_created) VALUES (?, ?, ?)',
+                     (str(uuid.uuid4()), name, '2024-01-01T00:00:00'))
+        return name
+    return write
+
+
+def fail_after(operation):
+    def write(conn):
+        operation(conn)
+        raise ValueError('Operation failed')
+    return write
+
+
+def customer_names(db):
+    return {row['name'] for row in db.execute('SELECT name FROM customers')}
+
+
+def test_failing_operation_keeps_its_neighbours(db):
+    outcomes = app.commit_writes(db, [insert_customer('Before'),
+                                      fail_after(insert_customer('Failed')),
+                                      insert_customer('After')])
+
+    assert [ok for ok, _ in outcomes] == [True, False, True]
+    assert isinstance(outcomes[1][1], ValueError)
+    assert customer_names(db) == {'Before', 'After'}
+
+
+def test_failing_queued_operation_keeps_its_neighbours(db, monkeypatch):
+    monkeypatch.setattr(app, 'WRITE_QUEUE', True)
+    batch_sizes = []
+    run_writes = app.run_writes
+
+    def record_batch(conn, operations):
+        batch_sizes.append(len(operations))
+        return run_writes(conn, operations)
+
+    monkeypatch.setattr(app, 'run_writes', record_batch)
+
+    # Hold the writer thread in a transaction while the operations queue
+    # up, so they are committed together in the next one
+    writing = threading.Event()
+    release = threading.Event()
+
+    def blocking(conn):
+        writing.set()
+        release.wait(10)
+
+    results = {}
+
+    def write(name, operation):
+        try:
+            results[name] = app.perform_write(operation, db)
+        except Exception as e:
+            results[name] = e
+
+    threads = [threading.Thread(target=write, args=('blocking', blocking))]
+    threads[0].start()
+    assert writing.wait(10)
+    for name, operation in [('before', insert_customer('Before')),
+                            ('failed', fail_after(insert_customer('Failed'))),
+                            ('after', insert_customer('After'))]:
+        threads.append(threading.Thread(target=write, args=(name, operation)))
+        threads[-1].start()
+        # Queue them in order
+        deadline = time.monotonic() + 10
+        while app.get_write_queue(db.database).qsize() < len(threads) - 1:
+            assert time.monotonic() < deadline
+            time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(10)
+
+    assert batch_sizes == [1, 3]
+    assert results['before'] == 'Before'
+    assert isinstance(results['failed'], ValueError)
+    assert results['after'] == 'After'
+    assert customer_names(db) == {'Before', 'After'}
+
+
+@pytest.mark.parametrize('write_queue', [False, True])
+def test_locked_database_returns_503(flask_app, client, db, monkeypatch, write_queue):
+    # Give up on the lock quickly; the request's connection is opened with
+    # the busy timeout in force when it is first used
+    monkeypatch.setattr(app, 'WRITE_QUEUE', write_queue)
+    monkeypatch.setattr(app, 'SQLITE_BUSY_TIMEOUT_MS', 20)
+    monkeypatch.setattr(app, 'WRITE_RETRIES', 1)
+    monkeypatch.setattr(app, 'WRITE_RETRY_BACKOFF_MS', 1)
+
+    other = sqlite3.connect(flask_app.config['DATABASE'], isolation_level=None)
+    other.execute('BEGIN IMMEDIATE')
+    try:
+        response = client.post('/api/customers', json={'name': 'Locked out'})
+    finally:
+        other.execute('ROLLBACK')
+        other.close()
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert 'Locked out' not in customer_names(db)
+
+    response = client.post('/api/customers', json={'name': 'Let in'})
+    assert response.status_code == 201